@@ -8,12 +8,20 @@
 # - Download files with progress tracking
 # - Real-time progress updates and cancellation support
 
-from .file_system_manager import *
-from .google_drive_handler import *
-from .huggingface_handler import *
-from .civitai_handler import *
-from .direct_upload_handler import *
-from .download_endpoints import *
+# Importing file_system_manager registers the HTTP routes with ComfyUI's server and
+# imports the handlers it serves, so their public names are re-exported from it
+from .file_system_manager import (
+    FileSystemManagerAPI,
+    FileSystemDownloadAPI,
+    GoogleDriveDownloaderAPI,
+    HuggingFaceDownloadAPI,
+    hf_progress_store,
+    CivitAIDownloadAPI,
+    civitai_progress_store,
+    DirectUploadAPI,
+    direct_upload_progress_store,
+    direct_upload_cancellation_flags,
+)
 
 # Register the API endpoint
 NODE_CLASS_MAPPINGS = {}
@@ -5,7 +5,9 @@ Browser Session Cleanup Utility for ComfyUI File System Manager
 This utility helps manage and clean up browser session data.
 """
 import asyncio
+import os
 import shutil
+import subprocess
 from pathlib import Path
 import sys
 import argparse
@@ -23,6 +25,68 @@ except ImportError as e:
     sys.exit(1)
 
 
+# Service name -> accessor for its session directory on the session manager
+SERVICE_PATHS = {
+    "google_drive": lambda manager: manager.google_session_path,
+    "huggingface": lambda manager: manager.huggingface_session_path,
+}
+
+# Service name -> heading used by show_session_info
+SERVICE_LABELS = {
+    "google_drive": "🔍 Google Drive",
+    "huggingface": "🤗 Hugging Face",
+}
+
+# Upper bound for the shutil fallback so a hung mount can't block the CLI forever
+RMTREE_FALLBACK_TIMEOUT = 120
+
+
+async def _rmtree_async(path: Path):
+    """Run shutil.rmtree in a worker thread so the event loop keeps running"""
+    await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
+
+
+async def _fast_rmtree(path: Path):
+    """Remove a directory tree using the native platform tool, falling back to shutil"""
+    if not path.exists():
+        return
+
+    try:
+        if os.name == 'nt':
+            await asyncio.to_thread(subprocess.check_call, ["cmd", "/c", "rd", "/s", "/q", str(path)])
+            return
+
+        process = await asyncio.create_subprocess_exec("rm", "-rf", str(path))
+        returncode = await process.wait()
+        if returncode == 0:
+            return
+        print(f"⚠️ rm exited with code {returncode} for {path}, falling back to shutil")
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"⚠️ Native removal failed for {path}: {e}, falling back to shutil")
+
+    try:
+        await asyncio.wait_for(_rmtree_async(path), timeout=RMTREE_FALLBACK_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"⚠️ Timed out removing {path} after {RMTREE_FALLBACK_TIMEOUT}s")
+
+
+def _dir_size(root: Path) -> int:
+    """Total size in bytes of all regular files under root, without following symlinks"""
+    total = 0
+    stack = [str(root)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            continue
+    return total
+
+
 async def cleanup_all_sessions():
     """Clean up all browser sessions and data"""
     print("🧹 Cleaning up all browser sessions...")
@@ -34,10 +98,23 @@ async def cleanup_all_sessions():
         await session_manager.cleanup_all()
         print("✅ Browser instances cleaned up")
         
-        # Remove session data directory
+        # Remove per-service session data concurrently, then the parent directory
         session_dir = session_manager.session_dir
         if session_dir.exists():
-            shutil.rmtree(session_dir)
+            service_paths = [getter(session_manager) for getter in SERVICE_PATHS.values()]
+            results = await asyncio.gather(
+                *(_fast_rmtree(path) for path in service_paths),
+                return_exceptions=True
+            )
+            for path, result in zip(service_paths, results):
+                if isinstance(result, Exception):
+                    print(f"⚠️ Failed to remove {path}: {result}")
+            
+            try:
+                os.rmdir(session_dir)
+            except OSError:
+                # Leftover files outside the service directories
+                await _fast_rmtree(session_dir)
             print(f"✅ Removed session directory: {session_dir}")
         else:
             print(f"ℹ️ Session directory doesn't exist: {session_dir}")
@@ -57,16 +134,14 @@ async def cleanup_service_session(service: str):
         await session_manager.cleanup_context(service)
         
         # Remove service-specific session data
-        if service == 'google_drive':
-            session_path = session_manager.google_session_path
-        elif service == 'huggingface':
-            session_path = session_manager.huggingface_session_path
-        else:
+        getter = SERVICE_PATHS.get(service)
+        if not getter:
             print(f"❌ Unknown service: {service}")
             return
+        session_path = getter(session_manager)
         
         if session_path.exists():
-            shutil.rmtree(session_path)
+            await _fast_rmtree(session_path)
             print(f"✅ Removed {service} session data: {session_path}")
         else:
             print(f"ℹ️ {service} session directory doesn't exist")
@@ -88,35 +163,23 @@ async def show_session_info():
     if session_dir.exists():
         print("\nSession data:")
         
-        # Check Google Drive session
-        google_session = session_manager.google_session_path
-        google_state_file = google_session / 'session_state.json'
-        print(f"\n🔍 Google Drive:")
-        print(f"  Directory: {google_session}")
-        print(f"  Exists: {'✅' if google_session.exists() else '❌'}")
-        print(f"  Session file: {'✅' if google_state_file.exists() else '❌'}")
-        
-        if google_state_file.exists():
-            file_size = google_state_file.stat().st_size
-            print(f"  Session file size: {file_size} bytes")
-        
-        # Check Hugging Face session
-        hf_session = session_manager.huggingface_session_path
-        hf_state_file = hf_session / 'session_state.json'
-        print(f"\n🤗 Hugging Face:")
-        print(f"  Directory: {hf_session}")
-        print(f"  Exists: {'✅' if hf_session.exists() else '❌'}")
-        print(f"  Session file: {'✅' if hf_state_file.exists() else '❌'}")
-        
-        if hf_state_file.exists():
-            file_size = hf_state_file.stat().st_size
-            print(f"  Session file size: {file_size} bytes")
+        for service, getter in SERVICE_PATHS.items():
+            service_session = getter(session_manager)
+            state_file = service_session / 'session_state.json'
+            print(f"\n{SERVICE_LABELS.get(service, service)}:")
+            print(f"  Directory: {service_session}")
+            print(f"  Exists: {'✅' if service_session.exists() else '❌'}")
+            print(f"  Session file: {'✅' if state_file.exists() else '❌'}")
+            
+            if state_file.exists():
+                file_size = state_file.stat().st_size
+                print(f"  Session file size: {file_size} bytes")
+            if service_session.exists():
+                service_size = _dir_size(service_session)
+                print(f"  Session data size: {service_size} bytes ({service_size / 1024:.1f} KB)")
         
         # Calculate total size
-        total_size = 0
-        for file_path in session_dir.rglob('*'):
-            if file_path.is_file():
-                total_size += file_path.stat().st_size
+        total_size = _dir_size(session_dir)
         
         print(f"\nTotal session data size: {total_size} bytes ({total_size / 1024:.1f} KB)")
     
@@ -124,11 +187,9 @@ async def show_session_info():
     try:
         # Try to check authentication status (this will show if browsers are active)
         print("\n🔍 Checking active browser instances...")
-        hf_auth = await session_manager.is_authenticated('huggingface')
-        gd_auth = await session_manager.is_authenticated('google_drive')
-        
-        print(f"Hugging Face authenticated: {'✅' if hf_auth else '❌'}")
-        print(f"Google Drive authenticated: {'✅' if gd_auth else '❌'}")
+        for service in SERVICE_PATHS:
+            authenticated = await session_manager.is_authenticated(service)
+            print(f"{SERVICE_LABELS.get(service, service)} authenticated: {'✅' if authenticated else '❌'}")
         
     except Exception as e:
         print(f"⚠️ Could not check authentication status: {e}")
@@ -164,30 +225,29 @@ async def reset_service_authentication(service: str):
         await session_manager.cleanup_all()
 
 
+DISPATCH = {
+    "info": show_session_info,
+    "cleanup": cleanup_all_sessions,
+    "cleanup-google": lambda: cleanup_service_session("google_drive"),
+    "cleanup-hf": lambda: cleanup_service_session("huggingface"),
+    "reset-google": lambda: reset_service_authentication("google_drive"),
+    "reset-hf": lambda: reset_service_authentication("huggingface"),
+}
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Browser Session Cleanup Utility for ComfyUI File System Manager"
     )
     parser.add_argument(
         "action",
-        choices=["info", "cleanup", "cleanup-google", "cleanup-hf", "reset-google", "reset-hf"],
+        choices=list(DISPATCH),
         help="Action to perform"
     )
     
     args = parser.parse_args()
     
-    if args.action == "info":
-        asyncio.run(show_session_info())
-    elif args.action == "cleanup":
-        asyncio.run(cleanup_all_sessions())
-    elif args.action == "cleanup-google":
-        asyncio.run(cleanup_service_session("google_drive"))
-    elif args.action == "cleanup-hf":
-        asyncio.run(cleanup_service_session("huggingface"))
-    elif args.action == "reset-google":
-        asyncio.run(reset_service_authentication("google_drive"))
-    elif args.action == "reset-hf":
-        asyncio.run(reset_service_authentication("huggingface"))
+    asyncio.run(DISPATCH[args.action]())
 
 
 if __name__ == "__main__":
@@ -1,12 +1,28 @@
+import logging
 from .api import CivitAIDownloadAPI
-from .progress import civitai_progress_store
+from .progress import civitai_progress_store, ProgressState
 
-# Import model config integration
-try:
-    from ..model_config_integration import model_config_manager
-    MODEL_CONFIG_AVAILABLE = True
-except ImportError:
-    print("Model config integration not available")
-    MODEL_CONFIG_AVAILABLE = False
+logger = logging.getLogger(__name__)
 
-__all__ = ['CivitAIDownloadAPI', 'civitai_progress_store', 'MODEL_CONFIG_AVAILABLE']
+# Model config integration is probed on first access (PEP 562)
+_model_config_available = None  # None = not probed yet
+_model_config_manager = None
+
+def _probe_model_config():
+    global _model_config_available, _model_config_manager
+    try:
+        from ..model_config_integration import model_config_manager
+        _model_config_manager = model_config_manager
+        _model_config_available = True
+    except ImportError:
+        logger.debug("Model config integration not available")
+        _model_config_available = False
+
+def __getattr__(name):
+    if name in ("model_config_manager", "MODEL_CONFIG_AVAILABLE"):
+        if _model_config_available is None:
+            _probe_model_config()
+        return _model_config_manager if name == "model_config_manager" else _model_config_available
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+__all__ = ['CivitAIDownloadAPI', 'civitai_progress_store', 'ProgressState', 'MODEL_CONFIG_AVAILABLE']
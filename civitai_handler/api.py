@@ -1,31 +1,68 @@
+import os
 import asyncio
 from .utils import CivitAIUtils
 from .downloader import CivitAIDownloader
 from .progress import ProgressTracker
-from ..shared_state import download_cancellation_flags
+from ..shared_state import download_cancellation_flags, download_cancel_events
 
-# Import model config integration
-try:
-    from ..model_config_integration import model_config_manager
-    MODEL_CONFIG_AVAILABLE = True
-except ImportError:
-    print("Model config integration not available")
-    MODEL_CONFIG_AVAILABLE = False
+# CivitAI token from the environment, read once at import
+_ENV_CIVITAI_TOKEN = os.environ.get("CIVITAI_API_KEY")
 
 class CivitAIDownloadAPI:
     def __init__(self):
         self.utils = CivitAIUtils()
         self.downloader = CivitAIDownloader()
 
+    async def close(self):
+        """Release the downloader's pooled HTTP connections"""
+        await self.downloader.close()
+
+    async def _run_cancellable(self, coro, session_id: str) -> dict:
+        """Run a download, cancelling it at its current await once the session's cancel event fires"""
+        if not session_id:
+            return await coro
+        
+        event = download_cancel_events.setdefault(session_id, asyncio.Event())
+        if download_cancellation_flags.get(session_id):
+            event.set()
+        task = asyncio.ensure_future(coro)
+        waiter = asyncio.ensure_future(event.wait())
+        try:
+            await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            waiter.cancel()
+        
+        if not task.done():
+            # The downloader's CancelledError handlers clean up and build the result
+            task.cancel()
+        try:
+            return await task
+        except asyncio.CancelledError:
+            return self._cancelled_result(session_id)
+
+    @staticmethod
+    def _cancelled_result(session_id: str) -> dict:
+        """Mark the session cancelled and build the cancellation response"""
+        ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
+        return {"success": False, "error": "Download cancelled by user"}
+
     async def download_from_civitai(self, civitai_url: str, target_fsm_path: str, 
                                    filename: str = None, overwrite: bool = False, 
                                    session_id: str = None, user_token: str = None, progress_callback=None):
         """Download a model from CivitAI with progress tracking and optional progress callback"""
+        # Resolve the cancellation check once so each probe is a single dict lookup
+        if session_id:
+            is_cancelled = lambda _get=download_cancellation_flags.get, _sid=session_id: _get(_sid)
+        else:
+            is_cancelled = lambda: False
+
         try:
             # Check for cancellation at the start
-            if session_id and download_cancellation_flags.get(session_id):
-                ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                return {"success": False, "error": "Download cancelled by user"}
+            if is_cancelled():
+                return self._cancelled_result(session_id)
                 
             ProgressTracker.update_progress(session_id, "Parsing CivitAI URL...", 5)
             
@@ -33,13 +70,11 @@ class CivitAIDownloadAPI:
             parsed_url = self.utils.parse_civitai_url(civitai_url)
             
             # Check for cancellation
-            if session_id and download_cancellation_flags.get(session_id):
-                ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                return {"success": False, "error": "Download cancelled by user"}
+            if is_cancelled():
+                return self._cancelled_result(session_id)
             
             # Use environment token by default, user token only if provided
-            import os
-            token_to_use = os.environ.get("CIVITAI_API_KEY")
+            token_to_use = _ENV_CIVITAI_TOKEN
             
             if user_token:
                 token_to_use = user_token
@@ -56,26 +91,26 @@ class CivitAIDownloadAPI:
                 version_id = parsed_url["version_id"]
                 direct_download_url = parsed_url.get("download_url")
                 
-                ProgressTracker.update_progress(
+                ProgressTracker.notify(
                     session_id,
                     f"Direct download URL detected (Version ID: {version_id})",
-                    10
+                    10,
+                    progress_callback
                 )
                 
-                # Call external progress callback if provided
-                if progress_callback:
-                    progress_callback(session_id, f"Direct download URL detected (Version ID: {version_id})", 10)
-                
                 # Download using direct URL with cancellation support
-                result = await self.downloader.download_model_async(
-                    model_id=None,  # Not needed for direct downloads
-                    version_id=version_id,
-                    target_fsm_path=target_fsm_path,
-                    filename=filename,
-                    token=token_to_use,
-                    session_id=session_id,
-                    direct_download_url=direct_download_url,
-                    progress_callback=progress_callback
+                result = await self._run_cancellable(
+                    self.downloader.download_model_async(
+                        model_id=None,  # Not needed for direct downloads
+                        version_id=version_id,
+                        target_fsm_path=target_fsm_path,
+                        filename=filename,
+                        token=token_to_use,
+                        session_id=session_id,
+                        direct_download_url=direct_download_url,
+                        progress_callback=progress_callback
+                    ),
+                    session_id
                 )
                 
                 return result
@@ -84,25 +119,25 @@ class CivitAIDownloadAPI:
                 model_id = parsed_url["model_id"]
                 version_id = parsed_url["version_id"]
                 
-                ProgressTracker.update_progress(
+                ProgressTracker.notify(
                     session_id,
                     f"Model ID: {model_id}" + (f", Version ID: {version_id}" if version_id else " (latest version)"),
-                    10
+                    10,
+                    progress_callback
                 )
                 
-                # Call external progress callback if provided
-                if progress_callback:
-                    progress_callback(session_id, f"Model ID: {model_id}" + (f", Version ID: {version_id}" if version_id else " (latest version)"), 10)
-                
                 # Download the model with cancellation support
-                result = await self.downloader.download_model_async(
-                    model_id=model_id,
-                    version_id=version_id,
-                    target_fsm_path=target_fsm_path,
-                    filename=filename,
-                    token=token_to_use,
-                    session_id=session_id,
-                    progress_callback=progress_callback
+                result = await self._run_cancellable(
+                    self.downloader.download_model_async(
+                        model_id=model_id,
+                        version_id=version_id,
+                        target_fsm_path=target_fsm_path,
+                        filename=filename,
+                        token=token_to_use,
+                        session_id=session_id,
+                        progress_callback=progress_callback
+                    ),
+                    session_id
                 )
                 
                 return result
@@ -116,8 +151,7 @@ class CivitAIDownloadAPI:
             ProgressTracker.set_error(session_id, error_msg)
             return {"success": False, "error": error_msg}
         finally:
-            # Clean up cancellation flag
-            if session_id and session_id in download_cancellation_flags:
-                del download_cancellation_flags[session_id]
-            if session_id and session_id in download_cancellation_flags:
-                del download_cancellation_flags[session_id]
+            # Clean up cancellation flag and event
+            if session_id:
+                download_cancellation_flags.pop(session_id, None)
+                download_cancel_events.pop(session_id, None)
@@ -1,167 +1,833 @@
 import os
+import json
+import time
+import hashlib
 import asyncio
+import functools
+import weakref
 import aiohttp
-import aiofiles
 from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
 from .utils import CivitAIUtils
 from .progress import ProgressTracker
 from ..shared_state import download_cancellation_flags
 
-# Import model config integration
 try:
-    from ..model_config_integration import model_config_manager
-    MODEL_CONFIG_AVAILABLE = True
+    import orjson
 except ImportError:
-    print("Model config integration not available")
-    MODEL_CONFIG_AVAILABLE = False
+    orjson = None
+
+class CivitAIError(ValueError):
+    """A CivitAI request failed with an HTTP error status"""
+
+class CivitAIAuthError(CivitAIError):
+    """The API token is missing or invalid (HTTP 401)"""
+
+class CivitAIAccessRestricted(CivitAIError):
+    """The resource is restricted by its owner or requires NSFW access (HTTP 403)"""
+
+class CivitAINotFound(CivitAIError):
+    """The model, version or file does not exist (HTTP 404)"""
+
+class _RangeNotSupported(Exception):
+    """A ranged request was answered with the full body (HTTP 200)"""
+
+# HTTP status -> (exception type, message template)
+_STATUS_ERRORS = {
+    401: (CivitAIAuthError, "Invalid CivitAI API token or authentication required"),
+    403: (CivitAIAccessRestricted, "Access denied - {kind} may be restricted or require NSFW access"),
+    404: (CivitAINotFound, "{subject} not found on CivitAI"),
+}
+
+def _check_status(response: aiohttp.ClientResponse, kind: str, ident: str = None, ok: tuple = (200,)):
+    """Raise the CivitAIError matching response.status unless it is one of ok"""
+    if response.status in ok:
+        return
+    error_type, template = _STATUS_ERRORS.get(
+        response.status, (CivitAIError, "CivitAI {kind} request failed: HTTP {status}")
+    )
+    subject = f"{kind.capitalize()} {ident}" if ident else kind.capitalize()
+    raise error_type(template.format(kind=kind, subject=subject, status=response.status))
+
+# On-disk cache of CivitAI API responses, revalidated with ETags once stale
+METADATA_CACHE_DIR = Path.home() / ".cache" / "comfy-fsm" / "civitai"
+METADATA_CACHE_TTL = 24 * 60 * 60  # seconds
+
+def _json_loads(data: bytes):
+    """Decode JSON with orjson when installed, stdlib json otherwise"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def _read_metadata_cache(cache_path: Path):
+    """Load a cached API response entry, or None if missing or unreadable"""
+    try:
+        return _json_loads(cache_path.read_bytes())
+    except (OSError, ValueError):
+        return None
+
+def _write_metadata_cache(cache_path: Path, entry: dict):
+    """Atomically store an API response entry; cache failures never fail a download"""
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(orjson.dumps(entry) if orjson else json.dumps(entry).encode('utf-8'))
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"⚠️ Failed to cache CivitAI metadata: {e}")
+
+# Downloaded models get a '<file>.meta.json' sidecar recording which CivitAI file they are,
+# so a later request for the same version can skip the download without re-checking it
+SIDECAR_SUFFIX = ".meta.json"
+
+# The .part name is deterministic so a later session can resume it; sessions that
+# target the same final path are serialized so they never share or delete its .part
+_final_path_locks = weakref.WeakValueDictionary()
+
+def _final_path_lock(final_path: Path) -> asyncio.Lock:
+    """Lock held while a session checks, downloads into and commits final_path"""
+    key = str(final_path)
+    lock = _final_path_locks.get(key)
+    if lock is None:
+        lock = _final_path_locks[key] = asyncio.Lock()
+    return lock
+
+def _sidecar_path(model_path: Path) -> Path:
+    return model_path.with_name(model_path.name + SIDECAR_SUFFIX)
+
+def _write_sidecar(model_path: Path, info: dict):
+    """Record a finished download's identity next to it; failures only cost a later re-check"""
+    try:
+        _sidecar_path(model_path).write_text(json.dumps(info), encoding='utf-8')
+    except OSError as e:
+        print(f"⚠️ Failed to write download metadata for {model_path.name}: {e}")
+
+def _sidecar_matches(sidecar: dict, version_id: str, file_id, size: int) -> bool:
+    """True when a sidecar describes this exact CivitAI file and the file on disk is complete"""
+    return (sidecar.get('version_id') == version_id
+            and sidecar.get('file_id') == file_id
+            and sidecar.get('size') == size)
+
+# A .part being streamed gets the same sidecar, holding the validator (strong ETag or
+# Last-Modified) of the response it was started from and how many bytes are known to be
+# written. The .part is preallocated to its full size, so after a crash its length says
+# nothing about progress; a later session resumes from the recorded offset with If-Range,
+# and a .part without a validator is downloaded again from byte 0
+PART_CHECKPOINT_BYTES = 64 * 1024 * 1024
+
+def _read_part_state(part_path: str) -> dict:
+    entry = _read_metadata_cache(_sidecar_path(Path(part_path)))
+    return entry if isinstance(entry, dict) else {}
+
+def _save_part_state(part_path: str, validator: Optional[str], offset: int = 0):
+    """Record the validator a .part was started under and its written offset, or drop a stale one"""
+    if validator:
+        _write_sidecar(Path(part_path), {"if_range": validator, "offset": offset})
+    else:
+        try:
+            _sidecar_path(Path(part_path)).unlink(missing_ok=True)
+        except OSError:
+            pass
+
+# Prioritize by type: Model > VAE > Config
+FILE_PRIORITIES = {
+    'Model': 3,
+    'VAE': 2,
+    'Config': 1,
+    'Pruned Model': 3,  # Same as Model
+    'Training Data': 0  # Lowest priority
+}
+
+# sizeKB from the API is rounded, so sizes within this many bytes count as equal
+SIZE_MATCH_TOLERANCE = 1024
+
+# Socket read buffer for the shared session and minimum size of each disk write
+READ_BUFSIZE = 4 * 1024 * 1024
+WRITE_BATCH_SIZE = 4 * 1024 * 1024
+# Chunks are written as one writev() batch without joining them; a batch is also
+# flushed once it holds this many chunks (well under IOV_MAX)
+WRITE_BATCH_MAX_CHUNKS = 64
+
+# Progress is published after this many bytes or seconds, whichever comes first
+PROGRESS_REPORT_BYTES = 8 * 1024 * 1024
+PROGRESS_REPORT_INTERVAL = 0.25
+
+# Written data this far behind the write position is dropped from the page cache
+# (POSIX_FADV_DONTNEED) once it has been hashed; model files are renamed into place,
+# not re-read, so only a pending SHA-256 pass keeps pages cached
+PAGE_CACHE_DROP_WINDOW = 64 * 1024 * 1024
+
+# Transient errors that make download_with_progress resume with a Range request
+DOWNLOAD_RETRY_ERRORS = (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError)
+DOWNLOAD_MAX_RETRIES = 5
+DOWNLOAD_RETRY_BACKOFF = 1  # seconds, doubled after every failed attempt
+
+# Files at least this large are split across parallel Range requests when supported
+RANGED_DOWNLOAD_MIN_SIZE = 64 * 1024 * 1024
+RANGED_DOWNLOAD_CONNECTIONS = int(os.environ.get("CIVITAI_DOWNLOAD_CONNECTIONS", 4))
+
+# Connection pool of the shared session: one download's segments plus metadata
+# requests fit under the per-host cap, so they never queue behind each other
+CONNECTOR_LIMIT = 16
+CONNECTOR_LIMIT_PER_HOST = RANGED_DOWNLOAD_CONNECTIONS + 2
+
+def _parse_content_range(value: str) -> tuple:
+    """Parse 'bytes start-end/total' into (start, total); total is 0 when unknown"""
+    try:
+        _, _, spec = value.partition(' ')
+        byte_range, _, total = spec.partition('/')
+        start = int(byte_range.split('-', 1)[0])
+        return start, (int(total) if total.isdigit() else 0)
+    except ValueError:
+        return -1, 0
+
+def _preallocate(fd: int, size: int):
+    """Reserve size bytes for fd up front so the filesystem can allocate contiguous extents"""
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass  # Filesystem doesn't support preallocation
+    os.ftruncate(fd, size)
+
+def _drop_page_cache(fd: int, offset: int, length: int):
+    """Advise the kernel that fd's [offset, offset+length) won't be read again (no-op where unsupported)"""
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+def _pwrite_all(fd: int, data: bytes, offset: int):
+    """os.pwrite until the whole buffer is written at offset"""
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+def _write_all(fd: int, data: bytes):
+    """os.write until the whole buffer is on disk (os.write may write partially)"""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+def _writev_all(fd: int, chunks: list) -> int:
+    """Write chunks at the current position with one writev() where available; returns the byte count"""
+    total = sum(map(len, chunks))
+    written = os.writev(fd, chunks) if hasattr(os, 'writev') else 0
+    if written < total:
+        # Partial (or no) vectored write: finish the remainder as one buffer
+        _write_all(fd, b"".join(chunks)[written:])
+    return total
+
+def _pwritev_all(fd: int, chunks: list, offset: int) -> int:
+    """Write chunks at offset with one pwritev() where available; returns the byte count"""
+    total = sum(map(len, chunks))
+    written = os.pwritev(fd, chunks, offset) if hasattr(os, 'pwritev') else 0
+    if written < total:
+        _pwrite_all(fd, b"".join(chunks)[written:], offset + written)
+    return total
+
+class _StreamDigest:
+    """SHA-256 of a file fed with its batches as they are written, in file order.
+
+    A batch written at any other position than the next expected byte (ranged
+    segments, resuming a leftover .part) invalidates the digest; a rewrite from
+    byte 0 starts it over.
+    """
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self.offset = 0
+
+    def feed(self, chunks: list, position: int):
+        if position == 0 and self.offset != 0:
+            self._hash = hashlib.sha256()
+            self.offset = 0
+        if position != self.offset:
+            self.offset = -1
+            return
+        for chunk in chunks:
+            self._hash.update(chunk)
+            self.offset += len(chunk)
+
+    @property
+    def broken(self) -> bool:
+        """True once a batch arrived out of order, so the file will need a read-back pass"""
+        return self.offset == -1
+
+    def hexdigest(self, size: int):
+        """Digest of the first size bytes, or None if the stream didn't cover exactly them"""
+        return self._hash.hexdigest() if self.offset == size else None
+
+def _sha256_file(path: str) -> str:
+    """SHA-256 of a file on disk, for downloads the stream digest couldn't cover"""
+    digest = hashlib.sha256()
+    with open(path, 'rb', buffering=0) as f:
+        buf = bytearray(WRITE_BATCH_SIZE)
+        view = memoryview(buf)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                # Verified; the pages won't be read again
+                _drop_page_cache(f.fileno(), 0, 0)
+                return digest.hexdigest()
+            digest.update(view[:n])
+
+def _feed_file_range(digest: _StreamDigest, path: str, start: int, length: int):
+    """Feed digest with length bytes of path from start (a ranged segment already on disk)"""
+    with open(path, 'rb', buffering=0) as f:
+        f.seek(start)
+        buf = bytearray(WRITE_BATCH_SIZE)
+        view = memoryview(buf)
+        offset, remaining = start, length
+        while remaining > 0:
+            n = f.readinto(view[:min(remaining, len(buf))])
+            if not n:
+                break
+            digest.feed([view[:n]], offset)
+            offset += n
+            remaining -= n
+        # The segment is hashed, so its pages can go now
+        _drop_page_cache(f.fileno(), start, length)
 
 class CivitAIDownloader:
     def __init__(self):
         self.utils = CivitAIUtils()
         self.api_base = "https://civitai.com/api/v1"
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._models_dir = Path(self.utils.comfyui_base) / "models"
+        self._checkpoints_dir = self._models_dir / "checkpoints"
 
-    async def get_model_info(self, model_id: str, token: str = None) -> dict:
-        """Get model information from CivitAI API"""
-        url = f"{self.api_base}/models/{model_id}"
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Shared HTTP session so metadata and file requests reuse pooled connections"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                # 1 hour total, 30s connect; a read stalled for 2 minutes raises
+                # asyncio.TimeoutError, which the download retry loop resumes from
+                timeout=aiohttp.ClientTimeout(total=3600, connect=30, sock_read=120),
+                read_bufsize=READ_BUFSIZE,
+                connector=aiohttp.TCPConnector(
+                    limit=CONNECTOR_LIMIT,
+                    limit_per_host=CONNECTOR_LIMIT_PER_HOST,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=75
+                )
+            )
+        return self._session
+
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        await self._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _fetch_metadata(self, url: str, kind: str, ident: str, token: str = None) -> dict:
+        """GET a CivitAI API JSON document, served from the on-disk cache while fresh"""
+        # Authenticated responses are keyed by a token fingerprint too, so one token's view
+        # of a restricted model is never served to another token or to anonymous requests
+        key = f"{url}\0{hashlib.sha256(token.encode('utf-8')).hexdigest()}" if token else url
+        cache_path = METADATA_CACHE_DIR / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json"
+        entry = await asyncio.to_thread(_read_metadata_cache, cache_path)
+        if entry and time.time() - entry.get('fetched_at', 0) < METADATA_CACHE_TTL:
+            return entry['data']
         
-        # Add token as query parameter if provided
-        if token:
-            url += f"?token={token}"
+        # The API accepts the token as a query parameter or a bearer header; send both
+        params = {"token": token} if token else None
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        if entry and entry.get('etag'):
+            headers["If-None-Match"] = entry['etag']
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 404:
-                    raise ValueError(f"Model {model_id} not found on CivitAI")
-                elif response.status == 401:
-                    raise ValueError("Invalid CivitAI API token")
-                elif response.status == 403:
-                    raise ValueError("Access denied - model may be restricted or require NSFW access")
-                elif response.status != 200:
-                    raise ValueError(f"CivitAI API error: {response.status}")
-                
-                return await response.json()
+        session = await self._get_session()
+        async with session.get(url, params=params, headers=headers) as response:
+            if response.status == 304 and entry:
+                entry['fetched_at'] = time.time()
+                await asyncio.to_thread(_write_metadata_cache, cache_path, entry)
+                return entry['data']
+            _check_status(response, kind, ident)
+            
+            data = _json_loads(await response.read())
+            entry = {"etag": response.headers.get('ETag'), "fetched_at": time.time(), "data": data}
+            await asyncio.to_thread(_write_metadata_cache, cache_path, entry)
+            return data
+
+    async def get_model_info(self, model_id: str, token: str = None) -> dict:
+        """Get model information from CivitAI API"""
+        return await self._fetch_metadata(f"{self.api_base}/models/{model_id}", "model", model_id, token)
 
     async def get_version_info(self, version_id: str, token: str = None) -> dict:
         """Get specific version information from CivitAI API"""
-        url = f"{self.api_base}/model-versions/{version_id}"
-        
-        # Add token as query parameter if provided
-        if token:
-            url += f"?token={token}"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 404:
-                    raise ValueError(f"Version {version_id} not found on CivitAI")
-                elif response.status == 401:
-                    raise ValueError("Invalid CivitAI API token")
-                elif response.status == 403:
-                    raise ValueError("Access denied - version may be restricted")
-                elif response.status != 200:
-                    raise ValueError(f"CivitAI API error: {response.status}")
-                
-                return await response.json()
+        return await self._fetch_metadata(f"{self.api_base}/model-versions/{version_id}", "version", version_id, token)
 
     def select_best_file(self, files: list) -> dict:
         """Select the best file from available options"""
         if not files:
             raise ValueError("No files available for download")
+        if len(files) == 1:
+            return files[0]
         
-        # Prioritize by type: Model > VAE > Config
-        file_priorities = {
-            'Model': 3,
-            'VAE': 2,
-            'Config': 1,
-            'Pruned Model': 3,  # Same as Model
-            'Training Data': 0  # Lowest priority
-        }
-        
-        # Sort by priority (highest first), then by size (largest first)
-        sorted_files = sorted(
-            files,
-            key=lambda f: (
-                file_priorities.get(f.get('type', ''), 0),
-                f.get('sizeKB', 0)
-            ),
-            reverse=True
-        )
-        
-        return sorted_files[0]
+        # Highest priority wins, then largest size
+        priority = FILE_PRIORITIES.get
+        return max(files, key=lambda f: (priority(f.get('type'), 0), f.get('sizeKB', 0)))
 
     async def download_with_progress(self, download_url: str, target_path: str, filename: str, 
-                                   session_id: str = None, token: str = None, progress_callback=None):
-        """Download file with real-time progress tracking and optional progress callback"""
+                                   session_id: str = None, token: str = None, progress_callback=None,
+                                   digest: _StreamDigest = None, expected_size: int = 0):
+        """Download file with real-time progress tracking and optional progress callback.
+
+        Transient network failures are retried with exponential backoff, resuming
+        from the bytes already in target_path via an HTTP Range request. Files whose
+        expected_size (from the API metadata) reaches RANGED_DOWNLOAD_MIN_SIZE are
+        fetched in parallel segments when the server honours byte ranges.
+        """
         # Add token as query parameter to download URL if provided
-        final_download_url = download_url
-        if token:
-            # Check if URL already has query parameters
-            separator = "&" if "?" in download_url else "?"
-            final_download_url = f"{download_url}{separator}token={token}"
+        params = {"token": token} if token else None
         
-        timeout = aiohttp.ClientTimeout(total=3600, connect=30)  # 1 hour total, 30s connect
+        session = await self._get_session()
         
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            # Check for cancellation before starting request
-            if session_id and download_cancellation_flags.get(session_id):
-                raise asyncio.CancelledError("Download cancelled by user")
-                
-            async with session.get(final_download_url) as response:
-                if response.status == 401:
-                    raise ValueError("Invalid CivitAI API token or authentication required")
-                elif response.status == 403:
-                    raise ValueError("Access denied - file may be restricted or require NSFW access")
-                elif response.status == 404:
-                    raise ValueError("File not found on CivitAI")
-                elif response.status != 200:
-                    raise ValueError(f"Download failed: HTTP {response.status}")
+        # Validator of the file being resumed, from a leftover .part's sidecar or
+        # learned from the first response
+        validators = {}
+        if os.path.exists(target_path):
+            state = await asyncio.to_thread(_read_part_state, target_path)
+            offset = state.get('offset')
+            if state.get('if_range') and isinstance(offset, int) and 0 < offset <= os.path.getsize(target_path):
+                # The .part may be preallocated past what was written; cut it back to the
+                # recorded offset so the resume's Range starts at the first missing byte
+                await asyncio.to_thread(os.truncate, target_path, offset)
+                validators['if_range'] = state['if_range']
+                print(f"🔄 Resuming {os.path.basename(target_path)} from byte {offset}")
+            else:
+                print(f"⚠️ {os.path.basename(target_path)} has no recorded resume point, downloading again")
+                Path(target_path).unlink(missing_ok=True)
+        
+        if (hasattr(os, 'pwrite') and expected_size >= RANGED_DOWNLOAD_MIN_SIZE
+                and not os.path.exists(target_path)):
+            # Only files known to be large pay for the range probe round-trip
+            probe = await self._probe_range_support(session, download_url, params)
+            if probe and probe[1] >= RANGED_DOWNLOAD_MIN_SIZE:
+                resolved_url, total_size = probe
+                try:
+                    return await self.download_with_progress_ranged(
+                        resolved_url, total_size, target_path, filename,
+                        session_id=session_id, progress_callback=progress_callback, digest=digest
+                    )
+                except _RangeNotSupported:
+                    print("⚠️ Server ignored Range for a segment, falling back to a single stream")
+        
+        attempt = 0
+        while True:
+            try:
+                downloaded = await self._download_attempt(
+                    session, download_url, params, target_path, filename, session_id, progress_callback,
+                    validators, digest
+                )
+                await asyncio.to_thread(_save_part_state, target_path, None)
+                return downloaded
+            except DOWNLOAD_RETRY_ERRORS as e:
+                attempt += 1
+                if attempt > DOWNLOAD_MAX_RETRIES:
+                    raise
+                delay = DOWNLOAD_RETRY_BACKOFF * 2 ** (attempt - 1)
+                print(f"⚠️ CivitAI download interrupted ({e!r}), resuming in {delay}s "
+                      f"(attempt {attempt}/{DOWNLOAD_MAX_RETRIES})")
+                await asyncio.sleep(delay)
+
+    async def _probe_range_support(self, session: aiohttp.ClientSession, download_url: str, params: dict):
+        """Return (resolved_url, total_size) if the server honours byte ranges, else None"""
+        try:
+            async with session.get(download_url, params=params, headers={"Range": "bytes=0-0"}) as response:
+                if response.status != 206:
+                    return None
+                _, total_size = _parse_content_range(response.headers.get('content-range', ''))
+                # The resolved URL is the signed CDN location, so segments skip the redirect
+                return (str(response.url), total_size) if total_size else None
+        except DOWNLOAD_RETRY_ERRORS:
+            return None
+
+    async def download_with_progress_ranged(self, download_url: str, total_size: int, target_path: str,
+                                            filename: str, session_id: str = None, progress_callback=None,
+                                            n_conns: int = RANGED_DOWNLOAD_CONNECTIONS,
+                                            digest: _StreamDigest = None) -> int:
+        """Download total_size bytes over n_conns parallel Range requests written with pwrite.
+
+        With a digest, the first segment is hashed as it is written and each later
+        segment is read back once it and every segment before it are on disk.
+        """
+        session = await self._get_session()
+        loop = asyncio.get_running_loop()
+        
+        ProgressTracker.notify(
+            session_id,
+            f"Starting download of {filename} ({n_conns} connections)...",
+            75,
+            progress_callback
+        )
+        
+        fd = os.open(target_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+        pending_writes = set()
+        report = self._make_progress_reporter(filename, total_size, session_id, progress_callback)
+        downloaded = 0
+        last_report_bytes = 0
+        last_report_time = loop.time()
+        
+        def pwrite_hashed(chunks: list, offset: int) -> int:
+            # Hashing runs in the same executor hop while the batch is still in cache
+            written = _pwritev_all(fd, chunks, offset)
+            digest.feed(chunks, offset)
+            return written
+        
+        async def write_at(chunks: list, offset: int, hashed: bool = False) -> int:
+            nonlocal downloaded, last_report_bytes, last_report_time
+            if hashed:
+                future = loop.run_in_executor(None, pwrite_hashed, chunks, offset)
+            else:
+                future = loop.run_in_executor(None, _pwritev_all, fd, chunks, offset)
+            pending_writes.add(future)
+            future.add_done_callback(pending_writes.discard)
+            # Shielded so a cancelled segment never leaves a write running against a closed fd
+            written = await asyncio.shield(future)
+            
+            downloaded += written
+            now = loop.time()
+            if (downloaded - last_report_bytes >= PROGRESS_REPORT_BYTES
+                    or now - last_report_time >= PROGRESS_REPORT_INTERVAL):
+                report(downloaded)
+                last_report_bytes = downloaded
+                last_report_time = now
+            return written
+        
+        async def drop_behind(advised: int, offset: int) -> int:
+            # Keep the last window cached; its pages may still be dirty
+            if offset - advised >= 2 * PAGE_CACHE_DROP_WINDOW:
+                await loop.run_in_executor(None, _drop_page_cache, fd, advised,
+                                           offset - PAGE_CACHE_DROP_WINDOW - advised)
+                return offset - PAGE_CACHE_DROP_WINDOW
+            return advised
+        
+        # Module constants bound once for the per-chunk loop below
+        bufsize, batch_size, max_chunks = READ_BUFSIZE, WRITE_BATCH_SIZE, WRITE_BATCH_MAX_CHUNKS
+        
+        async def fetch_segment(start: int, end: int):
+            offset = start
+            advised = start
+            attempt = 0
+            hashed = digest is not None and start == 0
+            # Later segments stay cached until they are read back for the digest
+            drop = digest is None or hashed
+            while offset <= end:
+                try:
+                    headers = {"Range": f"bytes={offset}-{end}"}
+                    async with session.get(download_url, headers=headers) as response:
+                        if response.status == 200:
+                            raise _RangeNotSupported()
+                        _check_status(response, "file", ok=(206,))
+                        batch = []
+                        append = batch.append
+                        batch_bytes = 0
+                        read = response.content.read
+                        while True:
+                            chunk = await read(bufsize)
+                            if not chunk:
+                                break
+                            append(chunk)
+                            batch_bytes += len(chunk)
+                            if batch_bytes >= batch_size or len(batch) >= max_chunks:
+                                offset += await write_at(batch, offset, hashed)
+                                batch = []
+                                append = batch.append
+                                batch_bytes = 0
+                                if drop:
+                                    advised = await drop_behind(advised, offset)
+                        if batch:
+                            offset += await write_at(batch, offset, hashed)
+                    if offset <= end:
+                        raise aiohttp.ClientPayloadError(f"Segment ended at byte {offset}, expected {end + 1}")
+                except DOWNLOAD_RETRY_ERRORS as e:
+                    attempt += 1
+                    if attempt > DOWNLOAD_MAX_RETRIES:
+                        raise
+                    delay = DOWNLOAD_RETRY_BACKOFF * 2 ** (attempt - 1)
+                    print(f"⚠️ CivitAI segment {start}-{end} interrupted ({e!r}), resuming at byte {offset} in {delay}s")
+                    await asyncio.sleep(delay)
+        
+        try:
+            await asyncio.to_thread(_preallocate, fd, total_size)
+            
+            segment_size = -(-total_size // n_conns)
+            bounds = [(start, min(start + segment_size, total_size) - 1)
+                      for start in range(0, total_size, segment_size)]
+            tasks = [asyncio.create_task(fetch_segment(start, end)) for start, end in bounds]
+            try:
+                if digest is not None:
+                    # Hash the contiguous prefix while the remaining segments download
+                    await tasks[0]
+                    for task, (start, end) in zip(tasks[1:], bounds[1:]):
+                        await task
+                        await asyncio.to_thread(_feed_file_range, digest, target_path, start, end - start + 1)
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            
+            report(downloaded)
+            return downloaded
+        except BaseException:
+            # Segments leave holes, so a failed ranged download can't be resumed; discard it
+            if pending_writes:
+                await asyncio.gather(*pending_writes, return_exceptions=True)
+            os.close(fd)
+            fd = None
+            Path(target_path).unlink(missing_ok=True)
+            raise
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    async def _download_attempt(self, session: aiohttp.ClientSession, download_url: str, params: dict,
+                                target_path: str, filename: str, session_id: str = None,
+                                progress_callback=None, validators: dict = None,
+                                digest: _StreamDigest = None) -> int:
+        """Single GET of download_url into target_path, resuming from its current size.
+
+        validators carries the file's strong ETag or Last-Modified between attempts;
+        it is sent as If-Range so a changed file comes back as a full 200 response.
+        """
+        if validators is None:
+            validators = {}
+        existing = os.path.getsize(target_path) if os.path.exists(target_path) else 0
+        headers = None
+        if existing:
+            headers = {"Range": f"bytes={existing}-"}
+            if validators.get('if_range'):
+                headers["If-Range"] = validators['if_range']
+        
+        async with session.get(download_url, params=params, headers=headers) as response:
+            if response.status == 416 and existing:
+                # Partial file is not a valid prefix (e.g. preallocated before a crash); start over
+                response.release()
+                os.truncate(target_path, 0)
+                return await self._download_attempt(
+                    session, download_url, params, target_path, filename, session_id, progress_callback,
+                    validators, digest
+                )
+            _check_status(response, "file", ok=(200, 206))
+            
+            if response.status == 200 or 'if_range' not in validators:
+                # Weak ETags are not allowed in If-Range, fall back to Last-Modified
+                etag = response.headers.get('ETag')
+                if etag and etag.startswith('W/'):
+                    etag = None
+                validators['if_range'] = etag or response.headers.get('Last-Modified')
+            if response.status == 200:
+                # Writing starts at byte 0: record what a later session must resume against
+                await asyncio.to_thread(_save_part_state, target_path, validators['if_range'])
+            
+            content_length = int(response.headers.get('content-length', 0))
+            if response.status == 206:
+                start, total_size = _parse_content_range(response.headers.get('content-range', ''))
+                if start != existing:
+                    raise ValueError(f"Download failed: server resumed at byte {start}, expected {existing}")
+                if not total_size and content_length:
+                    total_size = start + content_length
+            else:
+                start, total_size = 0, content_length
+            
+            ProgressTracker.notify(
+                session_id,
+                f"Resuming download of {filename}..." if start else f"Starting download of {filename}...",
+                75,
+                progress_callback
+            )
+            
+            flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+            if not start:
+                flags |= os.O_TRUNC
+            fd = os.open(target_path, flags, 0o644)
+            try:
+                os.lseek(fd, start, os.SEEK_SET)
+                if not start and total_size > 0:
+                    await asyncio.to_thread(_preallocate, fd, total_size)
                 
-                total_size = int(response.headers.get('content-length', 0))
-                downloaded = 0
+                # The written offset is checkpointed in the .part sidecar as it grows
+                checkpoint = None
+                if validators.get('if_range'):
+                    checkpoint = functools.partial(_save_part_state, target_path, validators['if_range'])
                 
-                ProgressTracker.update_progress(
-                    session_id,
-                    f"Starting download of {filename}...",
-                    75
+                # Network reads and disk writes overlap through a bounded queue
+                queue = asyncio.Queue(maxsize=4)
+                writer = asyncio.create_task(
+                    self._drain_to_file(
+                        queue, fd,
+                        self._make_progress_reporter(filename, total_size, session_id, progress_callback),
+                        start, digest, checkpoint
+                    )
                 )
+                # A bounded read() returns whatever the socket delivered (up to
+                # READ_BUFSIZE) without the async-iterator protocol per chunk;
+                # chunks are batched up to WRITE_BATCH_SIZE and handed to the
+                # writer as a list, so each executor hop is one writev()
+                batch = []
+                append = batch.append
+                batch_bytes = 0
+                # Everything the per-chunk loop touches is a local
+                read = response.content.read
+                put = queue.put
+                writer_done = writer.done
+                bufsize, batch_size, max_chunks = READ_BUFSIZE, WRITE_BATCH_SIZE, WRITE_BATCH_MAX_CHUNKS
                 
-                # Call external progress callback if provided
-                if progress_callback:
-                    progress_callback(session_id, f"Starting download of {filename}...", 75)
-                
-                async with aiofiles.open(target_path, 'wb') as file:
-                    chunk_size = 1024 * 1024  # 1MB chunks for better performance
+                try:
+                    while True:
+                        chunk = await read(bufsize)
+                        if not chunk:
+                            break
+                        if writer_done():
+                            break  # Writer failed, surface its exception below
+                        append(chunk)
+                        batch_bytes += len(chunk)
+                        if batch_bytes >= batch_size or len(batch) >= max_chunks:
+                            await put(batch)
+                            batch = []
+                            append = batch.append
+                            batch_bytes = 0
                     
-                    async for chunk in response.content.iter_chunked(chunk_size):
-                        # Check for cancellation on each chunk
-                        if session_id and download_cancellation_flags.get(session_id):
-                            # Clean up partial file
-                            try:
-                                await file.close()
-                                Path(target_path).unlink(missing_ok=True)
-                            except:
-                                pass
-                            raise asyncio.CancelledError("Download cancelled by user")
-                        
-                        await file.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        if total_size > 0:
-                            percentage = 75 + int((downloaded / total_size) * 20)  # Progress from 75% to 95%
-                            downloaded_formatted = self.utils.format_file_size(downloaded)
-                            total_formatted = self.utils.format_file_size(total_size)
-                            message = f"Downloading {filename}: {downloaded_formatted}/{total_formatted}"
-                        else:
-                            percentage = 85  # Fixed progress when size unknown
-                            downloaded_formatted = self.utils.format_file_size(downloaded)
-                            message = f"Downloading {filename}: {downloaded_formatted} (size unknown)"
-                        
-                        ProgressTracker.update_progress(session_id, message, percentage)
-                        
-                        # Call external progress callback if provided
-                        if progress_callback:
-                            progress_callback(session_id, message, percentage)
+                    if not writer.done():
+                        if batch:
+                            await queue.put(batch)
+                        await queue.put(None)
+                    downloaded = await writer
+                except BaseException:
+                    # Let the writer finish its in-flight write before the fd is closed
+                    while not queue.empty():
+                        queue.get_nowait()
+                    if not writer.done():
+                        queue.put_nowait(None)
+                    await asyncio.gather(writer, return_exceptions=True)
+                    raise
+            except asyncio.CancelledError:
+                # Clean up partial file
+                os.close(fd)
+                fd = None
+                Path(target_path).unlink(missing_ok=True)
+                _save_part_state(target_path, None)
+                raise
+            finally:
+                if fd is not None:
+                    # Keep only what was actually written so a retry resumes from a valid prefix
+                    written_to = os.lseek(fd, 0, os.SEEK_CUR)
+                    os.ftruncate(fd, written_to)
+                    os.close(fd)
+                    if validators.get('if_range'):
+                        _save_part_state(target_path, validators['if_range'], written_to)
+            
+            return downloaded
+
+    async def _drain_to_file(self, queue: asyncio.Queue, fd: int, report, downloaded: int = 0,
+                             digest: _StreamDigest = None, checkpoint=None) -> int:
+        """Write queued chunk batches to fd until the None sentinel, reporting on-disk progress.
+
+        checkpoint(offset), when given, is called every PART_CHECKPOINT_BYTES with the
+        offset written so far.
+        """
+        loop = asyncio.get_running_loop()
+        checkpointed = downloaded
+        
+        def write_batch(batch: list, position: int) -> int:
+            nonlocal checkpointed
+            # Hashing runs in the same executor hop while the batch is still in cache
+            written = _writev_all(fd, batch)
+            if digest is not None:
+                digest.feed(batch, position)
+            if checkpoint is not None and position + written - checkpointed >= PART_CHECKPOINT_BYTES:
+                checkpointed = position + written
+                checkpoint(checkpointed)
+            return written
+
+        last_report_bytes = downloaded
+        last_report_time = loop.time()
+        advised = downloaded
+        
+        try:
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    if downloaded != last_report_bytes:
+                        # Final update so the last bytes are always reported
+                        report(downloaded)
+                    return downloaded
                 
-                return downloaded
+                downloaded += await loop.run_in_executor(None, write_batch, batch, downloaded)
+                
+                # Keep the last window cached; its pages may still be dirty. Nothing is
+                # dropped once the digest is broken: the hash pass will read it all back
+                if (downloaded - advised >= 2 * PAGE_CACHE_DROP_WINDOW
+                        and (digest is None or not digest.broken)):
+                    await loop.run_in_executor(None, _drop_page_cache, fd, advised,
+                                               downloaded - PAGE_CACHE_DROP_WINDOW - advised)
+                    advised = downloaded - PAGE_CACHE_DROP_WINDOW
+                
+                now = loop.time()
+                if (downloaded - last_report_bytes >= PROGRESS_REPORT_BYTES
+                        or now - last_report_time >= PROGRESS_REPORT_INTERVAL):
+                    report(downloaded)
+                    last_report_bytes = downloaded
+                    last_report_time = now
+        except Exception:
+            # Unblock a producer waiting on a full queue so it can see the failure
+            while not queue.empty():
+                queue.get_nowait()
+            raise
+
+    def _make_progress_reporter(self, filename: str, total_size: int, session_id: str = None,
+                                progress_callback=None):
+        """Build report(downloaded) with the per-download parts of the message precomputed"""
+        format_file_size = self.utils.format_file_size
+        prefix = f"Downloading {filename}: "
+        last_mib = -1  # Nothing is formatted until the downloaded MiB count moves
+        
+        if total_size > 0:
+            suffix = f"/{format_file_size(total_size)}"
+            def report(downloaded: int):
+                nonlocal last_mib
+                mib = downloaded >> 20
+                if mib == last_mib and downloaded != total_size:
+                    return
+                last_mib = mib
+                percentage = 75 + int((downloaded / total_size) * 20)  # Progress from 75% to 95%
+                ProgressTracker.notify(session_id, prefix + format_file_size(downloaded) + suffix,
+                                       percentage, progress_callback)
+        else:
+            def report(downloaded: int):
+                nonlocal last_mib
+                mib = downloaded >> 20
+                if mib == last_mib:
+                    return
+                last_mib = mib
+                # Fixed progress when size unknown
+                ProgressTracker.notify(session_id, prefix + format_file_size(downloaded) + " (size unknown)",
+                                       85, progress_callback)
+        return report
+
+    @staticmethod
+    def _filename_from_direct_url(direct_download_url: str) -> str:
+        """Derive a default filename from an /api/download/models/<version_id> URL"""
+        path = urlsplit(direct_download_url).path
+        segments = [segment for segment in path.split('/') if segment]
+        for index in range(len(segments) - 2):
+            if segments[index] == 'download' and segments[index + 1] == 'models':
+                return f"civitai_model_{segments[index + 2]}"
+        return Path(path).name or "civitai_model_download"
 
     async def download_model_async(self, model_id: str, version_id: str = None, 
                                  target_fsm_path: str = None, filename: str = None,
@@ -172,149 +838,159 @@ class CivitAIDownloader:
         try:
             # Handle direct download URLs
             if direct_download_url:
-                # Check for cancellation at the start
-                if session_id and download_cancellation_flags.get(session_id):
-                    ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                    return {"success": False, "error": "Download cancelled by user"}
-                    
                 ProgressTracker.update_progress(session_id, "Using direct download URL...", 10)
                 
                 # Extract filename from URL or use provided filename
                 if not filename:
-                    # Try to get filename from URL parameters or use a default
-                    url_parts = direct_download_url.split('/')
-                    if 'models' in url_parts:
-                        model_version_id = url_parts[url_parts.index('models') + 1].split('?')[0]
-                        filename = f"civitai_model_{model_version_id}"
-                    else:
-                        filename = "civitai_model_download"
+                    filename = self._filename_from_direct_url(direct_download_url)
                 
                 # Determine target path
                 if target_fsm_path:
                     target_dir = self.utils.get_target_path(target_fsm_path)
                 else:
                     # Default to models/checkpoints for direct downloads
-                    target_dir = Path(self.utils.comfyui_base) / "models" / "checkpoints"
+                    target_dir = self._checkpoints_dir
                     target_dir.mkdir(parents=True, exist_ok=True)
                 
                 # Add appropriate extension if not present
-                if not Path(filename).suffix:
+                if not os.path.splitext(filename)[1]:
                     filename += ".safetensors"  # Default extension for CivitAI models
                 
                 final_filename = self.utils.get_safe_filename(filename)
                 final_path = target_dir / final_filename
                 
-                # Check for cancellation before file operations
-                if session_id and download_cancellation_flags.get(session_id):
-                    ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                    return {"success": False, "error": "Download cancelled by user"}
+                # Only one session at a time checks, downloads into and commits a given final path
+                async with _final_path_lock(final_path):
+                    # Check if file already exists
+                    if final_path.exists():
+                        ProgressTracker.set_completed(
+                            session_id,
+                            f"File already exists: {final_filename}"
+                        )
+                        return {
+                            "success": True,
+                            "message": f"File already exists: {final_filename}",
+                            "path": str(final_path)
+                        }
                 
-                # Check if file already exists
-                if final_path.exists():
-                    ProgressTracker.set_completed(
-                        session_id,
-                        f"File already exists: {final_filename}"
-                    )
-                    return {
-                        "success": True,
-                        "message": f"File already exists: {final_filename}",
-                        "path": str(final_path)
-                    }
-                
-                # Create temporary file for download
-                temp_path = self.utils.create_temp_file(final_filename)
+                    # Download straight into <final>.part; the name is fixed (not mkstemp) so a
+                    # later session can resume it, and the final-path lock keeps it single-writer
+                    temp_path = str(final_path.with_name(final_path.name + ".part"))
                 
-                try:
-                    ProgressTracker.update_progress(
-                        session_id,
-                        f"Starting direct download...",
-                        30
-                    )
+                    try:
+                        ProgressTracker.notify(
+                            session_id,
+                            f"Starting direct download...",
+                            30,
+                            progress_callback
+                        )
                     
-                    # Call external progress callback if provided
-                    if progress_callback:
-                        progress_callback(session_id, f"Starting direct download...", 30)
+                        # Download with progress using the direct URL
+                        downloaded_size = await self.download_with_progress(
+                            download_url=direct_download_url,
+                            target_path=temp_path,
+                            filename=final_filename,
+                            session_id=session_id,
+                            token=token,
+                            progress_callback=progress_callback
+                        )
                     
-                    # Download with progress using the direct URL
-                    downloaded_size = await self.download_with_progress(
-                        download_url=direct_download_url,
-                        target_path=temp_path,
-                        filename=final_filename,
-                        session_id=session_id,
-                        token=token,
-                        progress_callback=progress_callback
-                    )
+                        ProgressTracker.update_progress(
+                            session_id,
+                            f"Download completed, moving to final location...",
+                            95
+                        )
                     
-                    # Check for cancellation after download
-                    if session_id and download_cancellation_flags.get(session_id):
-                        # Clean up temp file
-                        self.utils.cleanup_temp_file(temp_path)
-                        ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                        return {"success": False, "error": "Download cancelled by user"}
+                        # Commit the .part file to its final name (atomic, same directory)
+                        await asyncio.to_thread(os.replace, temp_path, final_path)
                     
-                    ProgressTracker.update_progress(
-                        session_id,
-                        f"Download completed, moving to final location...",
-                        95
-                    )
-                    
-                    # Move from temp to final location
-                    final_path.parent.mkdir(parents=True, exist_ok=True)
-                    Path(temp_path).rename(final_path)
+                        # Register the model with the configuration manager
+                        # (resolved lazily through the package accessor)
+                        from . import MODEL_CONFIG_AVAILABLE, model_config_manager
+                        if MODEL_CONFIG_AVAILABLE:
+                            try:
+                                # Extract model info for registration
+                                model_config_manager.register_civitai_model(
+                                    local_path=str(final_path),
+                                    model_id=model_id,
+                                    version_id=version_id,
+                                    direct_url=direct_download_url if direct_download_url else None
+                                )
+                                print(f"📝 Model registered in config: {final_path}")
+                            except Exception as e:
+                                print(f"⚠️ Failed to register model in config: {e}")
                     
-                    # Register the model with the configuration manager
-                    if MODEL_CONFIG_AVAILABLE:
-                        try:
-                            # Extract model info for registration
-                            model_config_manager.register_civitai_model(
-                                local_path=str(final_path),
-                                model_id=model_id,
-                                version_id=version_id,
-                                direct_url=direct_download_url if direct_download_url else None
-                            )
-                            print(f"📝 Model registered in config: {final_path}")
-                        except Exception as e:
-                            print(f"⚠️ Failed to register model in config: {e}")
+                        success_message = f"Downloaded {final_filename} ({self.utils.format_file_size(downloaded_size)})"
+                        ProgressTracker.set_completed(session_id, success_message)
                     
-                    success_message = f"Downloaded {final_filename} ({self.utils.format_file_size(downloaded_size)})"
-                    ProgressTracker.set_completed(session_id, success_message)
-                    
-                    return {
-                        "success": True,
-                        "message": success_message,
-                        "path": str(final_path),
-                        "file_size": downloaded_size
-                    }
+                        return {
+                            "success": True,
+                            "message": success_message,
+                            "path": str(final_path),
+                            "file_size": downloaded_size
+                        }
                     
-                except asyncio.CancelledError:
-                    # Handle cancellation during download
-                    self.utils.cleanup_temp_file(temp_path)
-                    ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                    return {"success": False, "error": "Download cancelled by user"}
-                except Exception as download_error:
-                    # Clean up temp file on error
-                    self.utils.cleanup_temp_file(temp_path)
-                    raise download_error
+                    except asyncio.CancelledError:
+                        # Handle cancellation during download
+                        self.utils.cleanup_temp_file(temp_path)
+                        self.utils.cleanup_temp_file(str(_sidecar_path(Path(temp_path))))
+                        ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
+                        return {"success": False, "error": "Download cancelled by user"}
+                    except Exception as download_error:
+                        # Clean up temp file on error
+                        self.utils.cleanup_temp_file(temp_path)
+                        self.utils.cleanup_temp_file(str(_sidecar_path(Path(temp_path))))
+                        raise download_error
             
-            # Original model/version-based download logic with cancellation checks
-            if session_id and download_cancellation_flags.get(session_id):
-                ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                return {"success": False, "error": "Download cancelled by user"}
+            # A requested file that is already in place is checked before the model info
+            # round-trip: a sidecar naming the requested version at the size on disk needs no
+            # API call at all, and without a sidecar only the version info is fetched to
+            # compare sizes
+            version_info = None
+            if filename and target_fsm_path and version_id:
+                existing_filename = self.utils.get_safe_filename(filename)
+                existing_path = self.utils.get_target_path(target_fsm_path) / existing_filename
+                if existing_path.suffix and existing_path.is_file():
+                    existing_size = existing_path.stat().st_size
+                    sidecar = await asyncio.to_thread(_read_metadata_cache, _sidecar_path(existing_path))
+                    if isinstance(sidecar, dict):
+                        up_to_date = (sidecar.get('version_id') == str(version_id)
+                                      and sidecar.get('size') == existing_size)
+                    else:
+                        ProgressTracker.notify(session_id, f"Fetching version {version_id} information...", 5, progress_callback)
+                        version_info = await self.get_version_info(version_id, token)
+                        version_files = version_info.get('files', [])
+                        expected = self.select_best_file(version_files) if version_files else {}
+                        expected_size = expected.get('sizeKB', 0) * 1024
+                        up_to_date = (bool(version_files)
+                                      and existing_filename.endswith(os.path.splitext(expected.get('name', ''))[1])
+                                      and (not expected_size or abs(existing_size - expected_size) < SIZE_MATCH_TOLERANCE))
+                    if up_to_date:
+                        ProgressTracker.set_completed(
+                            session_id,
+                            f"File already exists: {existing_filename}"
+                        )
+                        return {
+                            "success": True,
+                            "message": f"File already exists: {existing_filename}",
+                            "path": str(existing_path)
+                        }
                 
-            ProgressTracker.update_progress(session_id, "Fetching model information...", 5)
-            
-            # Call external progress callback if provided
-            if progress_callback:
-                progress_callback(session_id, "Fetching model information...", 5)
-            
-            # Get model information
-            model_info = await self.get_model_info(model_id, token)
+            if version_info is not None:
+                # Version info was already fetched for the size check above
+                ProgressTracker.notify(session_id, "Fetching model information...", 5, progress_callback)
+                model_info = await self.get_model_info(model_id, token)
+            elif version_id:
+                # Model and version metadata are independent, so fetch them concurrently
+                ProgressTracker.notify(session_id, f"Fetching model and version {version_id} information...", 5, progress_callback)
+                model_info, version_info = await asyncio.gather(
+                    self.get_model_info(model_id, token),
+                    self.get_version_info(version_id, token)
+                )
+            else:
+                ProgressTracker.notify(session_id, "Fetching model information...", 5, progress_callback)
+                model_info = await self.get_model_info(model_id, token)
             
-            # Check for cancellation after API call
-            if session_id and download_cancellation_flags.get(session_id):
-                ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                return {"success": False, "error": "Download cancelled by user"}
-                
             model_name = model_info.get('name', f'Model_{model_id}')
             model_type = model_info.get('type', 'Checkpoint')
             
@@ -325,16 +1001,7 @@ class CivitAIDownloader:
             )
             
             # Select version
-            if version_id:
-                # Check for cancellation before version API call
-                if session_id and download_cancellation_flags.get(session_id):
-                    ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                    return {"success": False, "error": "Download cancelled by user"}
-                    
-                # Get specific version
-                ProgressTracker.update_progress(session_id, f"Fetching version {version_id} info...", 15)
-                version_info = await self.get_version_info(version_id, token)
-            else:
+            if not version_id:
                 # Use latest version
                 versions = model_info.get('modelVersions', [])
                 if not versions:
@@ -342,11 +1009,6 @@ class CivitAIDownloader:
                 version_info = versions[0]  # First version is usually the latest
                 version_id = str(version_info.get('id'))
             
-            # Check for cancellation after version selection
-            if session_id and download_cancellation_flags.get(session_id):
-                ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                return {"success": False, "error": "Download cancelled by user"}
-            
             version_name = version_info.get('name', f'Version_{version_id}')
             ProgressTracker.update_progress(
                 session_id,
@@ -373,25 +1035,20 @@ class CivitAIDownloader:
                 25
             )
             
-            # Check for cancellation before file operations
-            if session_id and download_cancellation_flags.get(session_id):
-                ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                return {"success": False, "error": "Download cancelled by user"}
-            
             # Determine target path
             if target_fsm_path:
                 target_dir = self.utils.get_target_path(target_fsm_path)
             else:
                 # Auto-determine based on model type
                 comfyui_model_type = self.utils.determine_model_type_from_metadata(model_info)
-                target_dir = Path(self.utils.comfyui_base) / "models" / comfyui_model_type
+                target_dir = self._models_dir / comfyui_model_type
                 target_dir.mkdir(parents=True, exist_ok=True)
             
             # Use provided filename or generate safe one
             if filename:
                 final_filename = self.utils.get_safe_filename(filename)
                 # Ensure it has the right extension
-                original_ext = Path(file_name).suffix
+                original_ext = os.path.splitext(file_name)[1]
                 if not final_filename.endswith(original_ext):
                     final_filename += original_ext
             else:
@@ -399,106 +1056,140 @@ class CivitAIDownloader:
             
             final_path = target_dir / final_filename
             
-            # Check if file already exists
-            if final_path.exists():
-                ProgressTracker.set_completed(
-                    session_id,
-                    f"File already exists: {final_filename}"
-                )
-                return {
-                    "success": True,
-                    "message": f"File already exists: {final_filename}",
-                    "path": str(final_path),
-                    "model_name": model_name,
-                    "version_name": version_name
-                }
+            file_id = selected_file.get('id')
+            expected_sha256 = (selected_file.get('hashes') or {}).get('SHA256')
             
-            # Create temporary file for download
-            temp_path = self.utils.create_temp_file(final_filename)
+            # Only one session at a time checks, downloads into and commits a given final path
+            async with _final_path_lock(final_path):
+                # An existing file is kept when its sidecar names this exact version and file,
+                # or (without a sidecar) when its size matches what CivitAI reports
+                if final_path.exists():
+                    existing_size = final_path.stat().st_size
+                    sidecar = await asyncio.to_thread(_read_metadata_cache, _sidecar_path(final_path))
+                    if sidecar:
+                        up_to_date = _sidecar_matches(sidecar, str(version_id), file_id, existing_size)
+                    else:
+                        up_to_date = not file_size or abs(existing_size - file_size) < SIZE_MATCH_TOLERANCE
+                    if up_to_date:
+                        ProgressTracker.set_completed(
+                            session_id,
+                            f"File already exists: {final_filename}"
+                        )
+                        return {
+                            "success": True,
+                            "message": f"File already exists: {final_filename}",
+                            "path": str(final_path),
+                            "model_name": model_name,
+                            "version_name": version_name
+                        }
+                    print(f"⚠️ {final_path} does not match CivitAI version {version_id}, re-downloading")
             
-            try:
-                ProgressTracker.update_progress(
-                    session_id,
-                    f"Starting download from CivitAI...",
-                    30
-                )
-                
-                # Call external progress callback if provided
-                if progress_callback:
-                    progress_callback(session_id, f"Starting download from CivitAI...", 30)
+                # Download straight into <final>.part; the name is fixed (not mkstemp) so a
+                # later session can resume it, and the final-path lock keeps it single-writer
+                temp_path = str(final_path.with_name(final_path.name + ".part"))
+            
+                try:
+                    ProgressTracker.notify(
+                        session_id,
+                        f"Starting download from CivitAI...",
+                        30,
+                        progress_callback
+                    )
                 
-                # Download with progress
-                downloaded_size = await self.download_with_progress(
-                    download_url=download_url,
-                    target_path=temp_path,
-                    filename=final_filename,
-                    session_id=session_id,
-                    token=token,
-                    progress_callback=progress_callback
-                )
+                    # Download with progress, hashing the bytes as they are written
+                    digest = _StreamDigest() if expected_sha256 else None
+                    downloaded_size = await self.download_with_progress(
+                        download_url=download_url,
+                        target_path=temp_path,
+                        filename=final_filename,
+                        session_id=session_id,
+                        token=token,
+                        progress_callback=progress_callback,
+                        digest=digest,
+                        expected_size=file_size
+                    )
                 
-                # Check for cancellation after download
-                if session_id and download_cancellation_flags.get(session_id):
-                    # Clean up temp file
-                    self.utils.cleanup_temp_file(temp_path)
-                    ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                    return {"success": False, "error": "Download cancelled by user"}
+                    ProgressTracker.update_progress(
+                        session_id,
+                        f"Download completed, moving to final location...",
+                        95
+                    )
                 
-                ProgressTracker.update_progress(
-                    session_id,
-                    f"Download completed, moving to final location...",
-                    95
-                )
+                    sha256 = None
+                    if expected_sha256:
+                        # Ranged or resumed downloads aren't hashed in order; they take one read pass
+                        sha256 = digest.hexdigest(downloaded_size) or await asyncio.to_thread(_sha256_file, temp_path)
+                        if sha256.upper() != expected_sha256.upper():
+                            raise ValueError(f"SHA256 mismatch for {final_filename}: "
+                                             f"expected {expected_sha256}, got {sha256.upper()}")
                 
-                # Move from temp to final location
-                final_path.parent.mkdir(parents=True, exist_ok=True)
-                Path(temp_path).rename(final_path)
+                    # Commit the .part file to its final name (atomic, same directory)
+                    await asyncio.to_thread(os.replace, temp_path, final_path)
+                    await asyncio.to_thread(_write_sidecar, final_path, {
+                        "version_id": str(version_id),
+                        "file_id": file_id,
+                        "size": downloaded_size,
+                        "sha256": sha256
+                    })
                 
-                success_message = f"Downloaded {final_filename} ({self.utils.format_file_size(downloaded_size)})"
-                ProgressTracker.set_completed(session_id, success_message)
+                    success_message = f"Downloaded {final_filename} ({self.utils.format_file_size(downloaded_size)})"
+                    ProgressTracker.set_completed(session_id, success_message)
                 
-                return {
-                    "success": True,
-                    "message": success_message,
-                    "path": str(final_path),
-                    "model_name": model_name,
-                    "version_name": version_name,
-                    "file_size": downloaded_size
-                }
+                    return {
+                        "success": True,
+                        "message": success_message,
+                        "path": str(final_path),
+                        "model_name": model_name,
+                        "version_name": version_name,
+                        "file_size": downloaded_size
+                    }
                 
-            except asyncio.CancelledError:
-                # Handle cancellation during download
-                self.utils.cleanup_temp_file(temp_path)
-                ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
-                return {"success": False, "error": "Download cancelled by user"}
-            except Exception as download_error:
-                # Clean up temp file on error
-                self.utils.cleanup_temp_file(temp_path)
-                raise download_error
+                except asyncio.CancelledError:
+                    # Handle cancellation during download
+                    self.utils.cleanup_temp_file(temp_path)
+                    self.utils.cleanup_temp_file(str(_sidecar_path(Path(temp_path))))
+                    ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
+                    return {"success": False, "error": "Download cancelled by user"}
+                except Exception as download_error:
+                    # Clean up temp file on error
+                    self.utils.cleanup_temp_file(temp_path)
+                    self.utils.cleanup_temp_file(str(_sidecar_path(Path(temp_path))))
+                    raise download_error
                 
         except asyncio.CancelledError:
             # Handle cancellation at any level
             ProgressTracker.set_cancelled(session_id, "Download cancelled by user")
             return {"success": False, "error": "Download cancelled by user"}
+        except CivitAIAuthError:
+            # 401: the token itself was rejected or is missing; the UI still offers to enter one
+            problem = "The CivitAI API token was rejected as invalid" if token else "A CivitAI API token is required for this model"
+            ProgressTracker.set_access_restricted(
+                session_id,
+                f"{problem}. Please input a valid CivitAI API token below and we will download it on your behalf.<br><br>Note that we don't store your CivitAI token on our servers."
+            )
+            return {
+                "success": False,
+                "error": "Invalid or missing CivitAI API token",
+                "error_type": "access_restricted"
+            }
+        except CivitAIAccessRestricted:
+            ProgressTracker.set_access_restricted(
+                session_id,
+                "We are unable to download this model because access is restricted by the owner. If you need it ASAP you can input your own CivitAI API token below. We will download it on your behalf. Make sure you have access to the model before proceeding.<br><br>Note that we don't store your CivitAI token on our servers."
+            )
+            return {
+                "success": False,
+                "error": "Access restricted - CivitAI API token required for private/restricted models",
+                "error_type": "access_restricted"
+            }
         except Exception as e:
             error_msg = str(e)
-            if "403" in error_msg or "Access denied" in error_msg or "authentication required" in error_msg:
-                ProgressTracker.set_access_restricted(
-                    session_id,
-                    "We are unable to download this model because access is restricted by the owner. If you need it ASAP you can input your own CivitAI API token below. We will download it on your behalf. Make sure you have access to the model before proceeding.<br><br>Note that we don't store your CivitAI token on our servers."
-                )
-                return {
-                    "success": False,
-                    "error": "Access restricted - CivitAI API token required for private/restricted models",
-                    "error_type": "access_restricted"
-                }
-            else:
-                ProgressTracker.set_error(session_id, error_msg)
-                return {
-                    "success": False,
-                    "error": error_msg
-                }
+            ProgressTracker.set_error(session_id, error_msg)
+            return {
+                "success": False,
+                "error": error_msg
+            }
         finally:
             # Clean up cancellation flag
-            if session_id and session_id in download_cancellation_flags:
-                del download_cancellation_flags[session_id]
+            if session_id:
+                download_cancellation_flags.pop(session_id, None)
@@ -1,60 +1,68 @@
 import time
+from dataclasses import dataclass
+from ..shared_state import DEBUG_PROGRESS
 
-# Global progress tracking for CivitAI downloads
+@dataclass(slots=True)
+class ProgressState:
+    """Mutable per-session progress, updated in place on every report"""
+    status: str
+    message: str
+    percentage: int
+
+# Global progress tracking for CivitAI downloads: session_id -> ProgressState
 civitai_progress_store = {}
 
 class ProgressTracker:
+    @staticmethod
+    def _set(session_id: str, status: str, message: str, percentage: int):
+        """Update the session's ProgressState in place, creating it on first use"""
+        state = civitai_progress_store.get(session_id)
+        if state is None:
+            civitai_progress_store[session_id] = ProgressState(status, message, percentage)
+        else:
+            state.status = status
+            state.message = message
+            state.percentage = percentage
+
     @staticmethod
     def update_progress(session_id: str, message: str, percentage: int, status: str = "progress"):
         """Update progress for a session"""
         if session_id:
-            civitai_progress_store[session_id] = {
-                "status": status, 
-                "message": message, 
-                "percentage": percentage
-            }
-            print(f"🔄 CivitAI Progress Update - Session: {session_id}, Percentage: {percentage}%, Message: {message}")
+            ProgressTracker._set(session_id, status, message, percentage)
+            if DEBUG_PROGRESS:
+                print(f"🔄 CivitAI Progress Update - Session: {session_id}, Percentage: {percentage}%, Message: {message}")
+
+    @staticmethod
+    def notify(session_id: str, message: str, percentage: int, progress_callback=None):
+        """Update progress for a session and forward it to an external callback if provided"""
+        ProgressTracker.update_progress(session_id, message, percentage)
+        if progress_callback:
+            progress_callback(session_id, message, percentage)
 
     @staticmethod
     def set_completed(session_id: str, message: str):
         """Mark session as completed"""
         if session_id:
-            civitai_progress_store[session_id] = {
-                "status": "completed", 
-                "message": message, 
-                "percentage": 100
-            }
+            ProgressTracker._set(session_id, "completed", message, 100)
             print(f"✅ CivitAI Completed - Session: {session_id}, Message: {message}")
 
     @staticmethod
     def set_error(session_id: str, message: str):
         """Mark session as error"""
         if session_id:
-            civitai_progress_store[session_id] = {
-                "status": "error", 
-                "message": message, 
-                "percentage": 0
-            }
+            ProgressTracker._set(session_id, "error", message, 0)
             print(f"❌ CivitAI Error - Session: {session_id}, Message: {message}")
 
     @staticmethod
     def set_access_restricted(session_id: str, message: str):
         """Mark session as access restricted"""
         if session_id:
-            civitai_progress_store[session_id] = {
-                "status": "access_restricted", 
-                "message": message, 
-                "percentage": 0
-            }
+            ProgressTracker._set(session_id, "access_restricted", message, 0)
             print(f"🔒 CivitAI Access Restricted - Session: {session_id}, Message: {message}")
 
     @staticmethod
     def set_cancelled(session_id: str, message: str):
         """Mark session as cancelled"""
         if session_id:
-            civitai_progress_store[session_id] = {
-                "status": "cancelled",
-                "message": message, 
-                "percentage": 0
-            }
+            ProgressTracker._set(session_id, "cancelled", message, 0)
             print(f"🚫 CivitAI Cancelled - Session: {session_id}, Message: {message}")
@@ -1,146 +1,167 @@
+import functools
 import os
 import re
-import tempfile
 from pathlib import Path
 import folder_paths
 
+# CivitAI URL forms accepted by parse_civitai_url, fused into one pattern compiled at
+# import. Alternatives are tried in the old order: API download, model+version, model page
+_URL_RE = re.compile(r"""
+    ^(?:https?://(?:www\.)?civitai\.com/)?
+    (?:
+        api/download/models/(?P<dl_version_id>\d+)
+      | models/(?P<model_id>\d+)
+        (?: .*[?&]modelVersionId=(?P<version_id>\d+)
+          | (?:\?.*)?$ )
+    )
+""", re.VERBOSE)
+_TOKEN_RE = re.compile(r"[&?]token=[^&]*")
+
+# strip_unsafe_chars keeps alphanumerics and "._- " (or "._-" without spaces): a
+# translate table drops the rest of ASCII in C, and the equivalent \w-based class
+# covers non-ASCII names
+_UNSAFE_ASCII_TABLE = {i: None for i in range(128)
+                       if not (chr(i).isalnum() or chr(i) in "._- ")}
+_UNSAFE_ASCII_TABLE_NO_SPACE = {i: None for i in range(128)
+                                if not (chr(i).isalnum() or chr(i) in "._-")}
+_UNSAFE_CHARS_RE = re.compile(r"[^\w.\- ]+")
+_UNSAFE_CHARS_NO_SPACE_RE = re.compile(r"[^\w.\-]+")
+
+# CivitAI model type (lowercased) -> ComfyUI models/ subfolder
+MODEL_TYPE_FOLDERS = {
+    'checkpoint': 'checkpoints',
+    'lora': 'loras',
+    'lycoris': 'loras',
+    'controlnet': 'controlnet',
+    'vae': 'vae',
+    'embedding': 'embeddings',
+    'textualinversion': 'embeddings',
+    'upscaler': 'upscale_models',
+    'poses': 'poses',
+    'wildcards': 'wildcards'
+}
+
+_SIZE_UNITS = ("B", "KB", "MB", "GB", "TB", "PB")
+_UNIT_DIVISORS = tuple(1024 ** i for i in range(len(_SIZE_UNITS)))
+
+def format_file_size(size_bytes: int) -> str:
+    """Format file size in human-readable units (shared with the direct upload handler)"""
+    if size_bytes == 0:
+        return "0 B"
+
+    # Unit index is floor(log1024(size)), read off the integer's bit length
+    unit_index = min((int(size_bytes).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    if unit_index == 0:  # Bytes
+        return f"{int(size_bytes)} B"
+    return f"{size_bytes / _UNIT_DIVISORS[unit_index]:.1f} {_SIZE_UNITS[unit_index]}"
+
+def strip_unsafe_chars(name: str, allow_space: bool = True) -> str:
+    """Drop characters that are unsafe in a filename (shared with the direct upload handler)"""
+    if name.isascii():
+        return name.translate(_UNSAFE_ASCII_TABLE if allow_space else _UNSAFE_ASCII_TABLE_NO_SPACE)
+    return (_UNSAFE_CHARS_RE if allow_space else _UNSAFE_CHARS_NO_SPACE_RE).sub("", name)
+
+@functools.lru_cache(maxsize=512)
+def _split_parts(fsm_relative_path: str) -> tuple:
+    """Split an FSM relative path into its parts (memoized; listings repeat the same few)"""
+    parts = fsm_relative_path.strip('/').split('/')
+    if parts == ['']:
+        raise ValueError("Invalid FSM relative path.")
+    return tuple(parts)
+
 class CivitAIUtils:
     def __init__(self):
         self.comfyui_base = folder_paths.base_path
+        self._target_path_cache = {}  # fsm_relative_path -> resolved directory
 
     def format_file_size(self, size_bytes: int) -> str:
         """Format file size in human-readable units"""
-        if size_bytes == 0:
-            return "0 B"
-        
-        units = ["B", "KB", "MB", "GB", "TB"]
-        unit_index = 0
-        size = float(size_bytes)
-        
-        while size >= 1024.0 and unit_index < len(units) - 1:
-            size /= 1024.0
-            unit_index += 1
-        
-        if unit_index == 0:  # Bytes
-            return f"{int(size)} {units[unit_index]}"
-        else:
-            return f"{size:.1f} {units[unit_index]}"
+        return format_file_size(size_bytes)
 
     def get_target_path(self, fsm_relative_path: str) -> Path:
         """Resolves an FSM relative path to an absolute path."""
-        path_parts = fsm_relative_path.strip('/').split('/')
-        if not path_parts:
-            raise ValueError("Invalid FSM relative path.")
+        return Path(self.get_target_path_str(fsm_relative_path))
 
-        current_path = Path(self.comfyui_base)
-        for part in path_parts:
-            current_path = current_path / part
+    def get_target_path_str(self, fsm_relative_path: str) -> str:
+        """Like get_target_path, but returns the absolute path as a plain string."""
+        cached = self._target_path_cache.get(fsm_relative_path)
+        # One stat instead of the mkdir chain; a directory removed since is recreated below
+        if cached is not None and os.path.isdir(cached):
+            return cached
         
-        current_path.mkdir(parents=True, exist_ok=True)
-        return current_path
+        full_path = os.path.join(self.comfyui_base, *_split_parts(fsm_relative_path))
+        os.makedirs(full_path, exist_ok=True)
+        self._target_path_cache[fsm_relative_path] = full_path
+        return full_path
 
     def parse_civitai_url(self, civitai_url: str) -> dict:
         """
         Parses a CivitAI URL to extract model_id and version_id.
         Returns: {'model_id': str, 'version_id': str or None, 'is_model_url': bool, 'is_direct_download': bool}
         """
-        # Pattern 1: Direct API download URLs (e.g., https://civitai.com/api/download/models/1838857?type=Model&format=SafeTensor)
-        api_download_match = re.match(r"^(?:https?://(?:www\.)?civitai\.com/)?api/download/models/(?P<version_id>\d+)", civitai_url)
-        if api_download_match:
-            # Clean URL by removing any existing token parameter
-            clean_url = re.sub(r'[&?]token=[^&]*', '', civitai_url)
-            
+        # Bare model IDs need no regex: "123456" or "123456:789"
+        if civitai_url.isdecimal():
             return {
-                "model_id": None,  # We don't have model_id from direct download URLs
-                "version_id": api_download_match.group("version_id"),
-                "is_model_url": False,
-                "is_direct_download": True,
-                "download_url": clean_url if clean_url.startswith('http') else f"https://civitai.com/{clean_url.lstrip('/')}"
-            }
-        
-        # Pattern 2: Model page URLs (e.g., https://civitai.com/models/123456)
-        model_match = re.match(r"^(?:https?://(?:www\.)?civitai\.com/)?models/(?P<model_id>\d+)(?:\?.*)?$", civitai_url)
-        if model_match:
-            return {
-                "model_id": model_match.group("model_id"),
+                "model_id": civitai_url,
                 "version_id": None,
                 "is_model_url": True,
                 "is_direct_download": False
             }
-        
-        # Pattern 3: Model with version (e.g., https://civitai.com/models/123456?modelVersionId=789)
-        version_match = re.match(r"^(?:https?://(?:www\.)?civitai\.com/)?models/(?P<model_id>\d+).*[?&]modelVersionId=(?P<version_id>\d+)", civitai_url)
-        if version_match:
+        model_id, sep, version_id = civitai_url.partition(':')
+        if sep and model_id.isdecimal() and version_id.isdecimal():
             return {
-                "model_id": version_match.group("model_id"),
-                "version_id": version_match.group("version_id"),
+                "model_id": model_id,
+                "version_id": version_id,
                 "is_model_url": True,
                 "is_direct_download": False
             }
         
-        # Pattern 4: Direct model ID (just numbers)
-        if re.match(r"^\d+$", civitai_url):
-            return {
-                "model_id": civitai_url,
-                "version_id": None,
-                "is_model_url": True,
-                "is_direct_download": False
-            }
+        # Only strings that can be CivitAI URLs go through the pattern
+        match = None
+        if 'civitai.com/' in civitai_url or civitai_url.startswith(('models/', 'api/')):
+            match = _URL_RE.match(civitai_url)
+        if match is None:
+            raise ValueError(f"Invalid CivitAI URL or model ID: {civitai_url}")
         
-        # Pattern 5: Model ID with version (123456:789)
-        id_version_match = re.match(r"^(?P<model_id>\d+):(?P<version_id>\d+)$", civitai_url)
-        if id_version_match:
+        # Direct API download URLs (e.g., https://civitai.com/api/download/models/1838857?type=Model&format=SafeTensor)
+        dl_version_id = match.group("dl_version_id")
+        if dl_version_id is not None:
+            # Clean URL by removing any existing token parameter
+            clean_url = _TOKEN_RE.sub('', civitai_url)
+            
             return {
-                "model_id": id_version_match.group("model_id"),
-                "version_id": id_version_match.group("version_id"),
-                "is_model_url": True,
-                "is_direct_download": False
+                "model_id": None,  # We don't have model_id from direct download URLs
+                "version_id": dl_version_id,
+                "is_model_url": False,
+                "is_direct_download": True,
+                "download_url": clean_url if clean_url.startswith('http') else f"https://civitai.com/{clean_url.lstrip('/')}"
             }
-            
-        raise ValueError(f"Invalid CivitAI URL or model ID: {civitai_url}")
+        
+        # Model page URLs, with or without a version
+        # (e.g., https://civitai.com/models/123456?modelVersionId=789)
+        return {
+            "model_id": match.group("model_id"),
+            "version_id": match.group("version_id"),
+            "is_model_url": True,
+            "is_direct_download": False
+        }
 
     def determine_model_type_from_metadata(self, model_info: dict) -> str:
         """Determine ComfyUI model type from CivitAI model metadata"""
-        model_type = model_info.get('type', '').lower()
-        
-        type_mapping = {
-            'checkpoint': 'checkpoints',
-            'lora': 'loras',
-            'lycoris': 'loras',
-            'controlnet': 'controlnet',
-            'vae': 'vae',
-            'embedding': 'embeddings',
-            'textualinversion': 'embeddings',
-            'upscaler': 'upscale_models',
-            'poses': 'poses',
-            'wildcards': 'wildcards'
-        }
-        
-        return type_mapping.get(model_type, 'checkpoints')
+        return MODEL_TYPE_FOLDERS.get(model_info.get('type', '').lower(), 'checkpoints')
 
     def get_safe_filename(self, filename: str) -> str:
         """Generate a safe filename by removing invalid characters"""
         # Remove invalid characters
-        safe_name = "".join(c for c in filename if c.isalnum() or c in "._- ")
-        safe_name = safe_name.strip()
-        
-        if not safe_name:
-            safe_name = "civitai_model"
-        
-        return safe_name
-
-    def create_temp_file(self, filename: str) -> str:
-        """Create a temporary file path"""
-        temp_dir = Path(tempfile.gettempdir())
-        safe_filename = self.get_safe_filename(filename)
-        temp_path = temp_dir / f"civitai_temp_{abs(hash(safe_filename)) % 10000}_{safe_filename}"
-        return str(temp_path)
+        return strip_unsafe_chars(filename).strip() or "civitai_model"
 
     def cleanup_temp_file(self, temp_path: str):
-        """Clean up temporary file"""
+        """Clean up temporary file (one unlink; a missing file is not an error)"""
+        if not temp_path:
+            return
         try:
-            if temp_path and Path(temp_path).exists():
-                Path(temp_path).unlink()
-                print(f"🗑️ Cleaned up temp file: {temp_path}")
-        except Exception as e:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
             print(f"⚠️ Failed to clean up temp file {temp_path}: {e}")
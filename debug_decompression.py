@@ -7,13 +7,51 @@ This test investigates what happens during the decompression process.
 import os
 import sys
 import tempfile
-import subprocess
 import tarfile
 from pathlib import Path
 
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
 # Add the current directory to Python path to import our modules
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+def _walk(root):
+    """Yield every DirEntry under root; type info comes from the scandir call"""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                yield entry
+
+def _tar_zst(src, archive, deref=False, arcname='.'):
+    """Write src into a .tar.zst archive; returns True on success"""
+    try:
+        with open(archive, 'wb') as raw, \
+                zstd.ZstdCompressor(level=3).stream_writer(raw) as zw, \
+                tarfile.open(fileobj=zw, mode='w|', dereference=deref) as tf:
+            tf.add(src, arcname=arcname)
+        return True
+    except (OSError, tarfile.TarError, zstd.ZstdError) as e:
+        print(f"❌ Archive creation failed: {e}")
+        return False
+
+def _untar_zst(archive, dst):
+    """Extract a .tar.zst archive into dst; returns True on success"""
+    try:
+        with open(archive, 'rb') as raw, \
+                zstd.ZstdDecompressor().stream_reader(raw) as zr, \
+                tarfile.open(fileobj=zr, mode='r|') as tf:
+            tf.extractall(dst, filter="data")
+        return True
+    except (OSError, tarfile.TarError, zstd.ZstdError) as e:
+        print(f"❌ Archive extraction failed: {e}")
+        return False
+
 def create_test_archive_with_symlinks():
     """Create a test archive that contains symlinks to see how they're handled"""
     print("🔍 Testing archive creation and extraction with symlinks...")
@@ -40,24 +78,10 @@ def create_test_archive_with_symlinks():
         print("\n🗜️ Test 1: Creating tar.zst with default tar settings...")
         archive_default = temp_path / "test_default.tar.zst"
         
-        # Create tar with symlinks preserved
-        tar_cmd = ['tar', '-chf', '-', '-C', str(source_dir), '.']
-        zstd_cmd = ['zstd', '-o', str(archive_default)]
-        
-        tar_process = subprocess.Popen(tar_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        zstd_process = subprocess.Popen(zstd_cmd, stdin=tar_process.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        tar_process.stdout.close()
-        
-        zstd_output, zstd_error = zstd_process.communicate()
-        tar_process.wait()
-        
-        if tar_process.returncode == 0 and zstd_process.returncode == 0:
-            print(f"✅ Archive created: {archive_default} ({archive_default.stat().st_size} bytes)")
-        else:
-            print(f"❌ Archive creation failed")
-            print(f"tar error: {tar_process.stderr.read().decode() if tar_process.stderr else 'None'}")
-            print(f"zstd error: {zstd_error.decode() if zstd_error else 'None'}")
+        # Create tar in-process (dereference matches `tar -h`)
+        if not _tar_zst(source_dir, archive_default, deref=True):
             return
+        print(f"✅ Archive created: {archive_default} ({archive_default.stat().st_size} bytes)")
         
         # Test 2: Extract and examine contents
         print("\n📦 Test 2: Extracting archive and examining contents...")
@@ -65,30 +89,17 @@ def create_test_archive_with_symlinks():
         extract_dir.mkdir()
         
         # Extract using our decompression method
-        zstd_cmd = ['zstd', '-d', '-c', str(archive_default)]
-        tar_cmd = ['tar', '-xf', '-', '-C', str(extract_dir)]
-        
-        zstd_process = subprocess.Popen(zstd_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        tar_process = subprocess.Popen(tar_cmd, stdin=zstd_process.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        zstd_process.stdout.close()
-        
-        tar_output, tar_error = tar_process.communicate()
-        zstd_process.wait()
-        
-        if tar_process.returncode == 0 and zstd_process.returncode == 0:
-            print("✅ Archive extracted successfully")
-        else:
-            print("❌ Archive extraction failed")
-            print(f"zstd error: {zstd_process.stderr.read().decode() if zstd_process.stderr else 'None'}")
-            print(f"tar error: {tar_error.decode() if tar_error else 'None'}")
+        if not _untar_zst(archive_default, extract_dir):
             return
+        print("✅ Archive extracted successfully")
         
         # Examine extracted contents
         print("\n🔍 Examining extracted contents...")
-        for item in extract_dir.rglob('*'):
-            if item.is_file():
-                size = item.stat().st_size
-                if item.is_symlink():
+        for entry in _walk(extract_dir):
+            if entry.is_file():
+                item = Path(entry.path)
+                size = entry.stat().st_size
+                if entry.is_symlink():
                     try:
                         target = item.readlink()
                         print(f"🔗 Symlink: {item.name} -> {target} ({size} bytes)")
@@ -117,41 +128,22 @@ def create_test_archive_with_symlinks():
         archive_deref = temp_path / "test_deref.tar.zst"
         
         # Create tar with symlinks dereferenced (follow symlinks)
-        tar_cmd = ['tar', '-chf', '-', '-C', str(source_dir), '.']  # -h follows symlinks
-        zstd_cmd = ['zstd', '-o', str(archive_deref)]
-        
-        tar_process = subprocess.Popen(tar_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        zstd_process = subprocess.Popen(zstd_cmd, stdin=tar_process.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        tar_process.stdout.close()
-        
-        zstd_output, zstd_error = zstd_process.communicate()
-        tar_process.wait()
-        
-        if tar_process.returncode == 0 and zstd_process.returncode == 0:
+        if _tar_zst(source_dir, archive_deref, deref=True):
             print(f"✅ Dereferenced archive created: {archive_deref} ({archive_deref.stat().st_size} bytes)")
             
             # Extract and examine dereferenced archive
             extract_deref_dir = temp_path / "extracted_deref"
             extract_deref_dir.mkdir()
             
-            zstd_cmd = ['zstd', '-d', '-c', str(archive_deref)]
-            tar_cmd = ['tar', '-xf', '-', '-C', str(extract_deref_dir)]
-            
-            zstd_process = subprocess.Popen(zstd_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            tar_process = subprocess.Popen(tar_cmd, stdin=zstd_process.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            zstd_process.stdout.close()
-            
-            tar_output, tar_error = tar_process.communicate()
-            zstd_process.wait()
-            
-            if tar_process.returncode == 0 and zstd_process.returncode == 0:
+            if _untar_zst(archive_deref, extract_deref_dir):
                 print("✅ Dereferenced archive extracted successfully")
                 
                 print("\n🔍 Examining dereferenced extracted contents...")
-                for item in extract_deref_dir.rglob('*'):
-                    if item.is_file():
-                        size = item.stat().st_size
-                        if item.is_symlink():
+                for entry in _walk(extract_deref_dir):
+                    if entry.is_file():
+                        item = Path(entry.path)
+                        size = entry.stat().st_size
+                        if entry.is_symlink():
                             target = item.readlink()
                             print(f"🔗 Symlink: {item.name} -> {target} ({size} bytes)")
                         else:
@@ -189,18 +181,7 @@ def test_simple_file_compression():
         # Compress it
         compressed_file = temp_path / "simple_model.tar.zst"
         
-        tar_cmd = ['tar', '-cf', '-', '-C', str(temp_path), original_file.name]
-        zstd_cmd = ['zstd', '-o', str(compressed_file)]
-        
-        tar_process = subprocess.Popen(tar_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        zstd_process = subprocess.Popen(zstd_cmd, stdin=tar_process.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        tar_process.stdout.close()
-        
-        zstd_output, zstd_error = zstd_process.communicate()
-        tar_process.wait()
-        
-        if tar_process.returncode != 0 or zstd_process.returncode != 0:
-            print("❌ Compression failed")
+        if not _tar_zst(original_file, compressed_file, arcname=original_file.name):
             return
         
         compressed_size = compressed_file.stat().st_size
@@ -211,20 +192,7 @@ def test_simple_file_compression():
         extract_dir = temp_path / "extract"
         extract_dir.mkdir()
         
-        zstd_cmd = ['zstd', '-d', '-c', str(compressed_file)]
-        tar_cmd = ['tar', '-xf', '-', '-C', str(extract_dir)]
-        
-        zstd_process = subprocess.Popen(zstd_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        tar_process = subprocess.Popen(tar_cmd, stdin=zstd_process.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        zstd_process.stdout.close()
-        
-        tar_output, tar_error = tar_process.communicate()
-        zstd_process.wait()
-        
-        if tar_process.returncode != 0 or zstd_process.returncode != 0:
-            print("❌ Decompression failed")
-            print(f"zstd error: {zstd_process.stderr.read().decode() if zstd_process.stderr else 'None'}")
-            print(f"tar error: {tar_error.decode() if tar_error else 'None'}")
+        if not _untar_zst(compressed_file, extract_dir):
             return
         
         # Find extracted file
@@ -254,5 +222,9 @@ if __name__ == "__main__":
     print("🚀 Debugging Decompression and Symlink Issues")
     print("=" * 60)
     
+    if zstd is None:
+        print("❌ zstandard library not available (pip install zstandard)")
+        sys.exit(1)
+    
     test_simple_file_compression()
     create_test_archive_with_symlinks()
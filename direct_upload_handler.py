@@ -1,11 +1,16 @@
 import os
+import time
 import asyncio
+import hashlib
 import aiohttp
 import aiofiles
 import tempfile
 from pathlib import Path
+from typing import Optional
 from urllib.parse import urlparse
 import folder_paths
+from .shared_state import DEBUG_PROGRESS
+from .civitai_handler.utils import format_file_size, strip_unsafe_chars
 
 # Import model config integration
 try:
@@ -21,49 +26,66 @@ direct_upload_progress_store = {}
 # Global cancellation tracking - defined here to avoid circular imports
 direct_upload_cancellation_flags = {}
 
+# Network chunks arrive at whatever size the socket delivers; they are batched
+# into disk writes sized from the observed throughput (about
+# WRITES_PER_SECOND writes), between the min and max below. Files under
+# SMALL_FILE_SIZE keep writes small so progress stays smooth.
+WRITE_FLUSH_MIN = 64 * 1024
+WRITE_FLUSH_MAX = 4 * 1024 * 1024
+WRITES_PER_SECOND = 10
+SMALL_FILE_SIZE = 10 * 1024 * 1024
+SMALL_FILE_FLUSH_MAX = 256 * 1024
+
+# Pool sizing for the shared HTTP session
+CONNECTOR_LIMIT = 32
+CONNECTOR_LIMIT_PER_HOST = 8
+
+# Seconds between progress updates from the download loop
+PROGRESS_REPORT_INTERVAL = 0.25
+
 class DirectUploadProgressTracker:
     @staticmethod
-    def update_progress(session_id: str, message: str, percentage: int, status: str = "progress"):
-        """Update progress for a session"""
-        if session_id:
+    def _set(session_id: str, status: str, message: str, percentage: int):
+        """Update the session's progress dict in place, creating it on first use"""
+        state = direct_upload_progress_store.get(session_id)
+        if state is None:
             direct_upload_progress_store[session_id] = {
-                "status": status, 
-                "message": message, 
+                "status": status,
+                "message": message,
                 "percentage": percentage
             }
-            print(f"🔄 Direct Upload Progress Update - Session: {session_id}, Percentage: {percentage}%, Message: {message}")
+        else:
+            state["status"] = status
+            state["message"] = message
+            state["percentage"] = percentage
+
+    @staticmethod
+    def update_progress(session_id: str, message: str, percentage: int, status: str = "progress"):
+        """Update progress for a session"""
+        if session_id:
+            DirectUploadProgressTracker._set(session_id, status, message, percentage)
+            if DEBUG_PROGRESS:
+                print(f"🔄 Direct Upload Progress Update - Session: {session_id}, Percentage: {percentage}%, Message: {message}")
 
     @staticmethod
     def set_completed(session_id: str, message: str):
         """Mark session as completed"""
         if session_id:
-            direct_upload_progress_store[session_id] = {
-                "status": "completed", 
-                "message": message, 
-                "percentage": 100
-            }
+            DirectUploadProgressTracker._set(session_id, "completed", message, 100)
             print(f"✅ Direct Upload Completed - Session: {session_id}, Message: {message}")
 
     @staticmethod
     def set_error(session_id: str, message: str):
         """Mark session as error"""
         if session_id:
-            direct_upload_progress_store[session_id] = {
-                "status": "error", 
-                "message": message, 
-                "percentage": 0
-            }
+            DirectUploadProgressTracker._set(session_id, "error", message, 0)
             print(f"❌ Direct Upload Error - Session: {session_id}, Message: {message}")
 
     @staticmethod
     def set_cancelled(session_id: str, message: str):
         """Mark session as cancelled"""
         if session_id:
-            direct_upload_progress_store[session_id] = {
-                "status": "cancelled",
-                "message": message, 
-                "percentage": 0
-            }
+            DirectUploadProgressTracker._set(session_id, "cancelled", message, 0)
             print(f"🚫 Direct Upload Cancelled - Session: {session_id}, Message: {message}")
 
 class DirectUploadUtils:
@@ -72,21 +94,7 @@ class DirectUploadUtils:
 
     def format_file_size(self, size_bytes: int) -> str:
         """Format file size in human-readable units"""
-        if size_bytes == 0:
-            return "0 B"
-        
-        units = ["B", "KB", "MB", "GB", "TB"]
-        unit_index = 0
-        size = float(size_bytes)
-        
-        while size >= 1024.0 and unit_index < len(units) - 1:
-            size /= 1024.0
-            unit_index += 1
-        
-        if unit_index == 0:  # Bytes
-            return f"{int(size)} {units[unit_index]}"
-        else:
-            return f"{size:.1f} {units[unit_index]}"
+        return format_file_size(size_bytes)
 
     def get_target_path(self, fsm_relative_path: str) -> Path:
         """Resolves an FSM relative path to an absolute path."""
@@ -105,8 +113,7 @@ class DirectUploadUtils:
         """Generate a safe filename from URL or custom name"""
         if custom_filename:
             # Clean custom filename
-            safe_name = "".join(c for c in custom_filename if c.isalnum() or c in "._- ")
-            safe_name = safe_name.strip()
+            safe_name = strip_unsafe_chars(custom_filename).strip()
             if not safe_name:
                 safe_name = "downloaded_file"
             return safe_name
@@ -117,20 +124,26 @@ class DirectUploadUtils:
         
         if not filename or '.' not in filename:
             # Generate filename from URL components
-            filename = f"download_{abs(hash(url)) % 10000}"
+            # (stable across restarts, unlike the per-process salted hash())
+            filename = f"download_{hashlib.blake2b(url.encode(), digest_size=6).hexdigest()}"
         
         # Clean filename
-        safe_name = "".join(c for c in filename if c.isalnum() or c in "._-")
+        safe_name = strip_unsafe_chars(filename, allow_space=False)
         if not safe_name:
             safe_name = "downloaded_file"
         
         return safe_name
 
-    def create_temp_file(self, filename: str) -> str:
-        """Create a temporary file path"""
-        temp_dir = Path(tempfile.gettempdir())
-        temp_path = temp_dir / f"direct_upload_{abs(hash(filename)) % 10000}_{filename}"
-        return str(temp_path)
+    def create_temp_file(self, filename: str, temp_dir: str = None) -> str:
+        """Create a temporary file path, in temp_dir if given so the final move stays on one filesystem.
+
+        The file is created empty with a random hidden '.<filename>.*.part' name, so concurrent
+        downloads of the same filename never share a temp path and a partial file never
+        carries a model extension.
+        """
+        fd, temp_path = tempfile.mkstemp(prefix=f".{filename}.", suffix=".part", dir=temp_dir)
+        os.close(fd)
+        return temp_path
 
     def cleanup_temp_file(self, temp_path: str):
         """Clean up temporary file"""
@@ -144,59 +157,97 @@ class DirectUploadUtils:
 class DirectUploadDownloader:
     def __init__(self):
         self.utils = DirectUploadUtils()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Shared HTTP session so back-to-back downloads reuse keep-alive connections"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=3600, connect=30),  # 1 hour total, 30s connect
+                connector=aiohttp.TCPConnector(
+                    limit=CONNECTOR_LIMIT,
+                    limit_per_host=CONNECTOR_LIMIT_PER_HOST,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=75
+                )
+            )
+        return self._session
+
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def download_with_progress(self, url: str, target_path: str, filename: str, 
                                    session_id: str = None, progress_callback=None):
         """Download file with real-time progress tracking"""
-        timeout = aiohttp.ClientTimeout(total=3600, connect=30)  # 1 hour total, 30s connect
+        session = await self._get_session()
         
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            # Check for cancellation before starting request
-            if session_id and direct_upload_cancellation_flags.get(session_id):
-                raise asyncio.CancelledError("Download cancelled by user")
-                
-            async with session.get(url) as response:
-                if response.status == 404:
-                    raise ValueError("File not found at the provided URL")
-                elif response.status == 403:
-                    raise ValueError("Access forbidden - the file may be restricted")
-                elif response.status != 200:
-                    raise ValueError(f"Download failed: HTTP {response.status}")
-                
-                total_size = int(response.headers.get('content-length', 0))
-                downloaded = 0
-                
-                DirectUploadProgressTracker.update_progress(
-                    session_id,
-                    f"Starting download of {filename}...",
-                    10
-                )
+        # Check for cancellation before starting request
+        if session_id and direct_upload_cancellation_flags.get(session_id):
+            raise asyncio.CancelledError("Download cancelled by user")
+            
+        async with session.get(url) as response:
+            if response.status == 404:
+                raise ValueError("File not found at the provided URL")
+            elif response.status == 403:
+                raise ValueError("Access forbidden - the file may be restricted")
+            elif response.status != 200:
+                raise ValueError(f"Download failed: HTTP {response.status}")
+            
+            total_size = int(response.headers.get('content-length', 0))
+            downloaded = 0
+            
+            DirectUploadProgressTracker.update_progress(
+                session_id,
+                f"Starting download of {filename}...",
+                10
+            )
+            
+            total_formatted = self.utils.format_file_size(total_size)
+            last_report_time = 0.0
+            
+            flush_max = SMALL_FILE_FLUSH_MAX if 0 < total_size < SMALL_FILE_SIZE else WRITE_FLUSH_MAX
+            flush_size = WRITE_FLUSH_MIN
+            started = time.monotonic()
+            
+            async with aiofiles.open(target_path, 'wb') as file:
+                write_buffer = bytearray()
                 
-                async with aiofiles.open(target_path, 'wb') as file:
-                    chunk_size = 1024 * 1024  # 1MB chunks for better performance
+                # iter_any yields data as soon as it is received instead of
+                # holding it back until a fixed-size chunk has accumulated
+                async for chunk in response.content.iter_any():
+                    # Check for cancellation on each chunk
+                    if session_id and direct_upload_cancellation_flags.get(session_id):
+                        # Clean up partial file
+                        try:
+                            await file.close()
+                            Path(target_path).unlink(missing_ok=True)
+                        except:
+                            pass
+                        raise asyncio.CancelledError("Download cancelled by user")
                     
-                    async for chunk in response.content.iter_chunked(chunk_size):
-                        # Check for cancellation on each chunk
-                        if session_id and direct_upload_cancellation_flags.get(session_id):
-                            # Clean up partial file
-                            try:
-                                await file.close()
-                                Path(target_path).unlink(missing_ok=True)
-                            except:
-                                pass
-                            raise asyncio.CancelledError("Download cancelled by user")
-                        
-                        await file.write(chunk)
-                        downloaded += len(chunk)
-                        
+                    write_buffer += chunk
+                    downloaded += len(chunk)
+                    now = time.monotonic()
+                    if len(write_buffer) >= flush_size:
+                        await file.write(write_buffer)
+                        write_buffer.clear()
+                        # Re-size the next write to the average rate so far
+                        elapsed = now - started
+                        if elapsed > 0:
+                            flush_size = min(flush_max, max(WRITE_FLUSH_MIN, int(downloaded / elapsed / WRITES_PER_SECOND)))
+                    
+                    # Throttle progress reporting; the last chunk always reports
+                    if now - last_report_time >= PROGRESS_REPORT_INTERVAL or downloaded == total_size:
+                        last_report_time = now
+                        downloaded_formatted = self.utils.format_file_size(downloaded)
                         if total_size > 0:
                             percentage = 10 + int((downloaded / total_size) * 80)  # Progress from 10% to 90%
-                            downloaded_formatted = self.utils.format_file_size(downloaded)
-                            total_formatted = self.utils.format_file_size(total_size)
                             message = f"Downloading {filename}: {downloaded_formatted}/{total_formatted}"
                         else:
                             percentage = 50  # Fixed progress when size unknown
-                            downloaded_formatted = self.utils.format_file_size(downloaded)
                             message = f"Downloading {filename}: {downloaded_formatted} (size unknown)"
                         
                         DirectUploadProgressTracker.update_progress(session_id, message, percentage)
@@ -204,7 +255,10 @@ class DirectUploadDownloader:
                         if progress_callback:
                             progress_callback(downloaded, total_size)
                 
-                return downloaded
+                if write_buffer:
+                    await file.write(write_buffer)
+            
+            return downloaded
 
     async def download_from_direct_url(self, url: str, target_fsm_path: str, 
                                      filename: str = None, overwrite: bool = False,
@@ -256,8 +310,9 @@ class DirectUploadDownloader:
                     "path": str(final_path)
                 }
             
-            # Create temporary file for download
-            temp_path = self.utils.create_temp_file(filename)
+            # Create temporary file for download next to the target, so the final
+            # rename is atomic and never crosses filesystems (/tmp is often tmpfs)
+            temp_path = self.utils.create_temp_file(filename, temp_dir=str(target_dir))
             
             try:
                 DirectUploadProgressTracker.update_progress(
@@ -287,12 +342,8 @@ class DirectUploadDownloader:
                     95
                 )
                 
-                # Move from temp to final location
-                final_path.parent.mkdir(parents=True, exist_ok=True)
-                if final_path.exists() and overwrite:
-                    final_path.unlink()
-                
-                Path(temp_path).rename(final_path)
+                # Move from temp to final location (atomic, replaces an existing file)
+                await asyncio.to_thread(os.replace, temp_path, final_path)
                 
                 # Register the model with the configuration manager
                 if MODEL_CONFIG_AVAILABLE:
@@ -345,6 +396,10 @@ class DirectUploadAPI:
     def __init__(self):
         self.downloader = DirectUploadDownloader()
 
+    async def close(self):
+        """Release the downloader's pooled HTTP connections"""
+        await self.downloader.close()
+
     async def upload_from_direct_url(self, url: str, target_fsm_path: str, 
                                    filename: str = None, overwrite: bool = False,
                                    session_id: str = None):
@@ -1,7 +1,9 @@
 import os
+import stat
 import sys
+import time
 import zipfile
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List
 import asyncio
@@ -21,23 +23,82 @@ from server import PromptServer
 from aiohttp import web, hdrs
 from aiohttp.web_response import StreamResponse
 
+# Read size for streaming files to the client; override with FSM_STREAM_CHUNK_SIZE (bytes)
+STREAM_CHUNK_SIZE = int(os.environ.get("FSM_STREAM_CHUNK_SIZE", 1024 * 1024))
+# Payloads that deflate barely shrinks (model weights, media, archives) go into zips
+# stored; everything else (json, yaml, text, code) is still deflated
+ZIP_STORED_EXTENSIONS = frozenset({
+    '.safetensors', '.ckpt', '.pt', '.pth', '.bin', '.gguf', '.onnx', '.sft',
+    '.png', '.jpg', '.jpeg', '.webp', '.gif', '.mp4', '.webm', '.mov', '.mkv',
+    '.mp3', '.flac', '.ogg', '.zip', '.gz', '.zst', '.7z', '.xz', '.bz2',
+})
+
+# Level 1 deflates ~3x faster than zlib's default 6 for a few percent in size
+ZIP_DEFLATE_LEVEL = 1
+
+# Archive chunks allowed in flight between the zip thread and the response
+ZIP_STREAM_QUEUE_DEPTH = 4
+
+# Zip threads live as long as the download (they wait on the client), so they get
+# their own pool instead of tying up the default executor used by aiofiles
+_ZIP_EXECUTOR = ThreadPoolExecutor(max_workers=max(2, (os.cpu_count() or 2) // 2),
+                                   thread_name_prefix="fsm-zip")
+
+
+class _ZipStreamSink:
+    """Write-only, non-seekable file object that zipfile writes into from a worker thread.
+
+    Output is coalesced into STREAM_CHUNK_SIZE pieces and handed to the event loop
+    through a bounded queue, so a slow client throttles the zip thread. None marks the end.
+    """
+    
+    def __init__(self, loop, queue: asyncio.Queue):
+        self._loop = loop
+        self._queue = queue
+        self._buffer = bytearray()
+        self.aborted = False
+    
+    def _put(self, item):
+        asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop).result()
+    
+    def write(self, data) -> int:
+        if self.aborted:
+            raise OSError("Zip stream aborted by client")
+        self._buffer += data
+        if len(self._buffer) >= STREAM_CHUNK_SIZE:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        if self._buffer and not self.aborted:
+            self._put(bytes(self._buffer))
+        self._buffer.clear()
+        self._put(None)
+
 class FileSystemDownloadAPI:
     """File system download endpoints for ComfyUI"""
     
     def __init__(self):
         # Get ComfyUI base path
         self.base_path = folder_paths.base_path # Corrected base path
+        # Normalized once; the trailing separator stops "/data" from matching "/data2/x"
+        self._base_norm = os.path.normpath(self.base_path)
+        self._base_prefix = os.path.join(self._base_norm, '')
     
     def _validate_path(self, file_path: str) -> tuple[bool, str]:
         """Validate file path for security"""
         if not file_path:
             return False, "No file path provided"
         
-        # Security check - ensure path is within ComfyUI directory
-        full_path = os.path.join(self.base_path, file_path)
-        full_path = os.path.normpath(full_path)
+        # Security check - ensure path is within ComfyUI directory. Symlinks are
+        # deliberately not resolved: model folders often link outside the base path
+        full_path = os.path.normpath(os.path.join(self._base_norm, file_path))
         
-        if not full_path.startswith(self.base_path):
+        if full_path != self._base_norm and not full_path.startswith(self._base_prefix):
             return False, "Access denied"
         
         return True, full_path
@@ -53,42 +114,31 @@ class FileSystemDownloadAPI:
             
             full_path = result
             
-            if not await aiofiles.os.path.exists(full_path):
+            # One stat in one executor hop covers both checks
+            try:
+                st = await aiofiles.os.stat(full_path)
+            except OSError:  # missing, dangling symlink, or a file used as a directory
                 return web.json_response({'error': 'File not found'}, status=404)
             
-            if not await aiofiles.os.path.isfile(full_path):
+            if not stat.S_ISREG(st.st_mode):
                 return web.json_response({'error': 'Path is not a file'}, status=400)
             
-            # Get file info
             filename = os.path.basename(full_path)
-            file_size = (await aiofiles.os.stat(full_path)).st_size
             
-            # Create response with proper headers
-            response = StreamResponse(
-                status=200,
+            # FileResponse sets Content-Length and sends the body with sendfile(2)
+            # where the transport allows it, falling back to chunked reads
+            return web.FileResponse(
+                full_path,
+                chunk_size=STREAM_CHUNK_SIZE,
                 headers={
                     hdrs.CONTENT_TYPE: 'application/octet-stream',
                     hdrs.CONTENT_DISPOSITION: f'attachment; filename="{filename}"',
                     hdrs.ACCESS_CONTROL_ALLOW_HEADERS: "*",
                     hdrs.ACCESS_CONTROL_ALLOW_METHODS: "*",
                     hdrs.ACCESS_CONTROL_ALLOW_ORIGIN: "*",
-                    hdrs.CONTENT_LENGTH: str(file_size)
                 }
             )
             
-            await response.prepare(request)
-            
-            # Stream file content
-            async with aiofiles.open(full_path, 'rb') as f:
-                while True:
-                    chunk = await f.read(8192)  # 8KB chunks
-                    if not chunk:
-                        break
-                    await response.write(chunk)
-            
-            await response.write_eof()
-            return response
-            
         except Exception as e:
             return web.json_response({'error': str(e)}, status=500)
 
@@ -101,75 +151,108 @@ class FileSystemDownloadAPI:
             if not file_paths:
                 return web.json_response({'error': 'No file paths provided'}, status=400)
             
-            # Validate all paths
-            valid_files = []
-            for file_path in file_paths:
-                is_valid, result = self._validate_path(file_path)
-                if not is_valid:
-                    continue
-                
-                full_path = result
-                if await aiofiles.os.path.exists(full_path) and await aiofiles.os.path.isfile(full_path):
-                    valid_files.append((file_path, full_path))
+            # Validate all paths in one executor hop rather than two per file
+            loop = asyncio.get_running_loop()
+            valid_files = await loop.run_in_executor(None, self._collect_regular_files, file_paths)
             
             if not valid_files:
                 return web.json_response({'error': 'No valid files found'}, status=404)
             
-            # Create temporary zip file
-            temp_dir = tempfile.gettempdir()
             zip_filename = f"files_{len(valid_files)}_items.zip"
-            temp_zip_path = os.path.join(temp_dir, zip_filename)
-            
-            # Create zip file
-            await self._create_zip_file(valid_files, temp_zip_path)
             
-            # Get zip file size
-            zip_size = (await aiofiles.os.stat(temp_zip_path)).st_size
-            
-            # Create response
+            # The archive is streamed as it is built: no temp file, no Content-Length
             response = StreamResponse(
                 status=200,
                 headers={
                     hdrs.CONTENT_TYPE: 'application/zip',
                     hdrs.CONTENT_DISPOSITION: f'attachment; filename="{zip_filename}"',
-                    hdrs.CONTENT_LENGTH: str(zip_size)
                 }
             )
-            
+            response.enable_chunked_encoding()
             await response.prepare(request)
             
-            # Stream zip file content
-            async with aiofiles.open(temp_zip_path, 'rb') as f:
-                while True:
-                    chunk = await f.read(8192)
-                    if not chunk:
-                        break
-                    await response.write(chunk)
-            
-            await response.write_eof()
-            
-            # Clean up temporary file
             try:
-                os.unlink(temp_zip_path)
-            except:
-                pass  # Best effort cleanup
+                await self._stream_zip(valid_files, response)
+            except Exception as e:
+                # Headers are already sent; drop the connection so the client
+                # sees a failed transfer instead of a truncated archive
+                print(f"❌ Zip stream aborted: {str(e)}")
+                if request.transport is not None:
+                    request.transport.abort()
+                return response
             
+            await response.write_eof()
             return response
             
         except Exception as e:
             print(f"Error creating zip download: {str(e)}")
             return web.json_response({'error': str(e)}, status=500)
 
-    async def _create_zip_file(self, file_list: List[tuple], zip_path: str):
-        """Create a zip file from a list of (relative_path, full_path) tuples"""
+    def _collect_regular_files(self, file_paths: List[str]) -> List[tuple]:
+        """Return (relative_path, full_path, stat_result) for each valid path that is an existing regular file"""
+        valid_files = []
+        for file_path in file_paths:
+            is_valid, full_path = self._validate_path(file_path)
+            if not is_valid:
+                continue
+            # One stat answers both "exists" and "is a regular file", and is
+            # reused for the zip entry header
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                valid_files.append((file_path, full_path, st))
+        return valid_files
+
+    async def _stream_zip(self, file_list: List[tuple], response: StreamResponse):
+        """Build the zip in a worker thread and write it to the response as it is produced"""
+        queue = asyncio.Queue(maxsize=ZIP_STREAM_QUEUE_DEPTH)
+        sink = _ZipStreamSink(asyncio.get_running_loop(), queue)
+        zip_task = asyncio.ensure_future(self._create_zip_file(file_list, sink))
+        try:
+            while (chunk := await queue.get()) is not None:
+                await response.write(chunk)
+        except BaseException:
+            # Drain until the end marker so a zip thread blocked on a full
+            # queue can run into the abort and exit
+            sink.aborted = True
+            while await queue.get() is not None:
+                pass
+            await asyncio.gather(zip_task, return_exceptions=True)
+            raise
+        await zip_task
+
+    async def _create_zip_file(self, file_list: List[tuple], fileobj):
+        """Write a zip of (relative_path, full_path, stat_result) tuples into a writable file object"""
         def _create_zip():
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for relative_path, full_path in file_list:
-                    # Use the relative path structure in the zip
-                    # This preserves the directory structure
-                    arcname = relative_path.replace('\\', '/')  # Normalize path separators
-                    zipf.write(full_path, arcname)
+            try:
+                # Deflated entries go through zipf.write, which applies the archive-level
+                # compresslevel; strict_timestamps=False clamps pre-1980 mtimes like below
+                with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED, allowZip64=True,
+                                     compresslevel=ZIP_DEFLATE_LEVEL, strict_timestamps=False) as zipf:
+                    for relative_path, full_path, st in file_list:
+                        # Use the relative path structure in the zip
+                        # This preserves the directory structure
+                        arcname = relative_path.replace('\\', '/')  # Normalize path separators
+                        ext = os.path.splitext(arcname)[1].lower()
+                        if ext not in ZIP_STORED_EXTENSIONS:
+                            zipf.write(full_path, arcname)
+                            continue
+                        # Stored entries (the large ones) build their header from the
+                        # validation stat (what ZipInfo.from_file would stat again) and
+                        # stream in STREAM_CHUNK_SIZE reads; zip dates start at 1980
+                        date_time = max(time.localtime(st.st_mtime)[:6], (1980, 1, 1, 0, 0, 0))
+                        zinfo = zipfile.ZipInfo(arcname, date_time=date_time)
+                        zinfo.file_size = st.st_size
+                        zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+                        zinfo.compress_type = zipfile.ZIP_STORED
+                        with open(full_path, 'rb') as src, zipf.open(zinfo, 'w') as dest:
+                            while chunk := src.read(STREAM_CHUNK_SIZE):
+                                dest.write(chunk)
+            finally:
+                fileobj.close()
         
         # Run in thread to avoid blocking
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, _create_zip)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_ZIP_EXECUTOR, _create_zip)
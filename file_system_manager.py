@@ -1,10 +1,12 @@
 import os
+import stat
 import subprocess
 import json
 import tempfile
 import shutil
 import asyncio
 from pathlib import Path
+from dataclasses import asdict
 from typing import Dict, Any, List
 from urllib.parse import unquote
 import folder_paths
@@ -12,6 +14,11 @@ from server import PromptServer as PS
 from aiohttp import web
 from .routes.missing_models_routes import setup_missing_models_routes
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Import the new global models manager
 try:
     from .global_models_manager import GlobalModelsManager, global_models_progress_store
@@ -41,11 +48,14 @@ except ImportError:
 # Import Hugging Face Handler
 from .huggingface_handler import HuggingFaceDownloadAPI, hf_progress_store
 # Import CivitAI Handler
-from .civitai_handler import CivitAIDownloadAPI, civitai_progress_store
+from .civitai_handler import CivitAIDownloadAPI, civitai_progress_store, ProgressState
 
 # Import Direct Upload Handler
 from .direct_upload_handler import DirectUploadAPI, direct_upload_progress_store, direct_upload_cancellation_flags
 
+# General cancellation flags, shared with the handlers that poll them (google_drive_handler imports them from here)
+from .shared_state import download_cancellation_flags, request_cancellation
+
 # Import Sync Manager Integration
 try:
     from .sync_manager_integration import sync_manager_api
@@ -151,70 +161,62 @@ class FileSystemManagerAPI:
             local_items = {}
             
             if path_exists_locally and is_local_path_allowed:
-                for item in sorted(target_path.iterdir(), key=lambda x: (not x.is_dir(), x.name.lower())):
-                    try:
-                        actual_target = None  # Initialize actual_target
-                        symlink_target_exists = False  # Initialize
-                        is_symlink = item.is_symlink()
-                        
-                        if is_symlink:
-                            try:
-                                actual_target = item.resolve()
-                                if actual_target.exists():
-                                    item_stat = actual_target.stat()
-                                    symlink_target_exists = True
-                                else:
-                                    item.unlink()
+                # Display paths are "<root>/<sub path>/<name>"; the prefix is
+                # computed once for the directory rather than per entry
+                sub_path = target_path.relative_to(self.allowed_directories[root_dir]).as_posix()
+                display_prefix = root_dir if sub_path == '.' else f"{root_dir}/{sub_path}"
+                
+                # scandir hands back type info with each entry, so a regular entry
+                # costs one stat; the final contents.sort() orders everything
+                with os.scandir(target_path) as entries:
+                    for entry in entries:
+                        try:
+                            actual_target = None  # Initialize actual_target
+                            is_symlink = entry.is_symlink()
+                            
+                            if is_symlink:
+                                try:
+                                    # stat() follows the link; a dangling link raises
+                                    item_stat = entry.stat()
+                                    actual_target = Path(entry.path).resolve()
+                                except FileNotFoundError:
+                                    # Dangling link: its target is gone, remove the link itself
+                                    try:
+                                        os.unlink(entry.path)
+                                    except Exception:
+                                        pass  # Ignore error if unlinking fails
+                                    continue
+                                except OSError as e:
+                                    # Link loops, permission or I/O errors are not proof the target is gone
+                                    print(f"⚠️ Skipping symlink {entry.path}: {e}")
                                     continue
-                            except (OSError, FileNotFoundError):
+                            else:
                                 try:
-                                    item.unlink()
-                                except Exception:
-                                    pass  # Ignore error if unlinking fails
-                                continue
-                        else:
-                            if not item.exists():
-                                continue
-                            try:
-                                item_stat = item.stat()
-                            except (OSError, FileNotFoundError):
-                                continue
-                        
-                        item_relative_path = item.relative_to(
-                            self.allowed_directories[root_dir])
-                        item_display_path = (f"{root_dir}/{item_relative_path}"
-                                             .replace("\\", "/"))
-
-                        if (is_symlink and symlink_target_exists and
-                                actual_target):
-                            item_type = ('directory' if actual_target.is_dir()
-                                         else 'file')
-                            item_size = (item_stat.st_size if
-                                         actual_target.is_file() else None)
-                        else:
-                            item_type = ('directory' if item.is_dir() else
-                                         'file')
-                            item_size = (item_stat.st_size if item.is_file()
-                                         else None)
-
-                        item_data = {
-                            'name': item.name,
-                            'path': item_display_path,
-                            'type': item_type,
-                            'size': item_size,
-                            'modified': item_stat.st_mtime,
-                            'local_exists': True,
-                            'global_exists': False,
-                            'downloadable': False,
-                            'is_symlink': is_symlink,  # Mark symlinks
-                            'symlink_target': (str(actual_target)
-                                               if is_symlink and actual_target
-                                               else None)
-                        }
-                        contents.append(item_data)
-                        local_items[item.name] = item_data
-                    except Exception as e_item:
-                        print(f"⚠️ Error processing item {item}: {e_item}")
+                                    item_stat = entry.stat(follow_symlinks=False)
+                                except OSError:
+                                    continue
+                            
+                            # For symlinks this describes the link target
+                            is_dir = stat.S_ISDIR(item_stat.st_mode)
+                            item_data = {
+                                'name': entry.name,
+                                'path': f"{display_prefix}/{entry.name}",
+                                'type': 'directory' if is_dir else 'file',
+                                'size': (item_stat.st_size if stat.S_ISREG(item_stat.st_mode)
+                                         else None),
+                                'modified': item_stat.st_mtime,
+                                'local_exists': True,
+                                'global_exists': False,
+                                'downloadable': False,
+                                'is_symlink': is_symlink,  # Mark symlinks
+                                'symlink_target': (str(actual_target)
+                                                   if is_symlink and actual_target
+                                                   else None)
+                            }
+                            contents.append(item_data)
+                            local_items[entry.name] = item_data
+                        except Exception as e_item:
+                            print(f"⚠️ Error processing item {entry.path}: {e_item}")
             
             if root_dir == 'models' and global_models_manager:
                 try:
@@ -625,6 +627,13 @@ hf_download_api = HuggingFaceDownloadAPI()
 civitai_download_api = CivitAIDownloadAPI()
 direct_upload_api = DirectUploadAPI()
 
+async def _close_download_sessions(app):
+    """Close pooled HTTP sessions held by the download handlers"""
+    await civitai_download_api.close()
+    await direct_upload_api.close()
+
+PS.instance.app.on_shutdown.append(_close_download_sessions)
+
 # --- API Endpoints ---
 
 @PS.instance.routes.get("/filesystem/browse")
@@ -836,19 +845,19 @@ async def download_from_civitai_endpoint(request):
     except Exception as e:
         print(f"Error in /filesystem/download_from_civitai: {e}")
         session_id = data.get('session_id') if 'data' in locals() and isinstance(data, dict) else None
-        if session_id: civitai_progress_store[session_id] = {"status": "error", "message": str(e), "percentage": 0}
+        if session_id: civitai_progress_store[session_id] = ProgressState("error", str(e), 0)
         return web.json_response({'success': False, 'error': str(e)}, status=500)
 
 @PS.instance.routes.get("/filesystem/civitai_progress/{session_id}")
 async def get_civitai_progress_endpoint(request):
     try:
         session_id = request.match_info['session_id']
-        progress = civitai_progress_store.get(session_id, {"status": "not_found", "message": "Session not found", "percentage": 0})
-        return web.json_response(progress)
+        progress = civitai_progress_store.get(session_id)
+        if progress is None:
+            return web.json_response({"status": "not_found", "message": "Session not found", "percentage": 0})
+        return web.json_response(asdict(progress))
     except Exception as e: return web.json_response({"status": "error", "message": str(e), "percentage": 0}, status=500)
 
-download_cancellation_flags = {} # General cancellation flags, might be superseded by type-specific
-
 @PS.instance.routes.post("/filesystem/cancel_download")
 async def cancel_download_endpoint(request):
     try:
@@ -867,16 +876,17 @@ async def cancel_download_endpoint(request):
             gdrive_progress_store[session_id] = {"status": "cancelled", "message": "User cancelled", "percentage": 0}
         elif download_type == 'huggingface':
             # hf_handler should check its own cancellation flags
-            download_cancellation_flags[session_id] = True
+            request_cancellation(session_id)
             hf_progress_store[session_id] = {"status": "cancelled", "message": "User cancelled", "percentage": 0}
         elif download_type == 'civitai':
-            # civitai_handler should check its own cancellation flags
-            civitai_progress_store[session_id] = {"status": "cancelled", "message": "User cancelled", "percentage": 0}
+            # Interrupts the running CivitAI download at its current await
+            request_cancellation(session_id)
+            civitai_progress_store[session_id] = ProgressState("cancelled", "User cancelled", 0)
         elif download_type == 'direct-link':
             direct_upload_cancellation_flags[session_id] = True # This flag is used by direct_upload_handler
             direct_upload_progress_store[session_id] = {"status": "cancelled", "message": "User cancelled", "percentage": 0}
         else: # Generic cancellation if type is unknown or not handled by specific flags
-            download_cancellation_flags[session_id] = True
+            request_cancellation(session_id)
             # Also set the direct_upload_cancellation_flags as a common fallback for now
             direct_upload_cancellation_flags[session_id] = True
 
@@ -926,6 +936,9 @@ async def get_direct_upload_progress_endpoint(request):
     try:
         session_id = request.match_info['session_id']
         progress = direct_upload_progress_store.get(session_id, {"status": "not_found", "message": "Session not found", "percentage": 0})
+        if orjson:
+            # Polled several times a second per download; orjson encodes straight to bytes
+            return web.Response(body=orjson.dumps(progress), content_type='application/json')
         return web.json_response(progress)
     except Exception as e: return web.json_response({"status": "error", "message": str(e), "percentage": 0}, status=500)
 
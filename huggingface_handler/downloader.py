@@ -182,9 +182,8 @@ class HuggingFaceDownloader:
     def _download_with_hf_transfer_progress(self, repo_id: str, filename: str, token: str = None, progress_callback=None, session_id: str = None):
         """Download using hf_transfer with progress tracking via subprocess output capture"""
         safe_suffix = f"_{Path(filename).name}"
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=safe_suffix)
-        temp_file_path = temp_file.name
-        temp_file.close()
+        fd, temp_file_path = tempfile.mkstemp(suffix=safe_suffix)
+        os.close(fd)
         
         try:
             # Check for cancellation before starting
@@ -338,17 +337,19 @@ except Exception as e:
         if os.path.islink(cached_path):
             actual_path = os.path.realpath(cached_path)
             if os.path.exists(actual_path):
-                with tempfile.NamedTemporaryFile(delete=False, suffix=safe_fallback_suffix) as temp_file:
-                    shutil.copy2(actual_path, temp_file.name)
-                    self.utils.cleanup_cache_file(cached_path, actual_path)
-                    return temp_file.name
+                fd, temp_file_path = tempfile.mkstemp(suffix=safe_fallback_suffix)
+                os.close(fd)
+                shutil.copy2(actual_path, temp_file_path)
+                self.utils.cleanup_cache_file(cached_path, actual_path)
+                return temp_file_path
             else:
                 raise FileNotFoundError(f"Symlink target does not exist: {actual_path}")
         else:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=safe_fallback_suffix) as temp_file:
-                shutil.copy2(cached_path, temp_file.name)
-                self.utils.cleanup_cache_file(cached_path)
-                return temp_file.name
+            fd, temp_file_path = tempfile.mkstemp(suffix=safe_fallback_suffix)
+            os.close(fd)
+            shutil.copy2(cached_path, temp_file_path)
+            self.utils.cleanup_cache_file(cached_path)
+            return temp_file_path
 
     async def snapshot_download_with_progress_async(self, repo_id: str, token: str = None, progress_callback=None):
         """Async version of snapshot download with proper progress tracking"""
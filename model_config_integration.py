@@ -15,6 +15,90 @@ from typing import Optional
 logger = logging.getLogger(__name__)
 
 
+# Explicit model_type -> model group mapping for _determine_model_group
+MODEL_TYPE_GROUPS = {
+    # Core model types from ComfyUI nodes.py
+    'checkpoint': 'checkpoints',
+    'checkpoints': 'checkpoints',
+    'diffusion_model': 'diffusion_models',
+    'rembg': 'rembg',
+    'diffusion_models': 'diffusion_models',
+    'unet': 'unet',
+    'vae': 'vae',
+    'vae_approx': 'vae_approx',
+    'text_encoder': 'text_encoders',
+    'text_encoders': 'text_encoders',
+    'clip': 'clip',
+    'clip_vision': 'clip_vision',
+    'lora': 'loras',
+    'loras': 'loras',
+    'controlnet': 'controlnet',
+    't2i_adapter': 'controlnet',
+    'embedding': 'embeddings',
+    'embeddings': 'embeddings',
+    'upscale_model': 'upscale_models',
+    'upscale_models': 'upscale_models',
+    'style_model': 'style_models',
+    'style_models': 'style_models',
+    'gligen': 'gligen',
+    'hypernetwork': 'hypernetworks',
+    'hypernetworks': 'hypernetworks',
+    'photomaker': 'photomaker',
+    'classifier': 'classifiers',
+    'classifiers': 'classifiers',
+    'diffuser': 'diffusers',
+    'diffusers': 'diffusers',
+    # Additional custom node types
+    'ipadapter': 'ipadapter',
+    'ip_adapter': 'ipadapter',
+    'animatediff': 'animatediff',
+    'motion_module': 'animatediff',
+    'insightface': 'insightface',
+    'face_analysis': 'insightface',
+    'instantid': 'instantid',
+    'inpaint': 'inpaint',
+    'segmentation': 'segmentation',
+    'depth_estimation': 'depth_estimation',
+    'pose_estimation': 'pose_estimation',
+    'video_model': 'video_models',
+    'audio_model': 'audio_models',
+}
+
+# Path substring rules for _determine_model_group, built once at import.
+# Order matters - more specific patterns first
+_PATH_GROUP_RULES = (
+    # Core ComfyUI model directories from folder_paths.py
+    (('checkpoints', 'checkpoint'), 'checkpoints'),
+    (('diffusion_models', 'unet'), 'diffusion_models'),
+    (('vae_approx', 'taesd'), 'vae_approx'),
+    (('vae',), 'vae'),
+    (('clip_vision',), 'clip_vision'),
+    (('text_encoders', 't5'), 'text_encoders'),
+    (('loras', 'lora'), 'loras'),
+    (('controlnet', 't2i_adapter'), 'controlnet'),
+    (('embeddings', 'embedding'), 'embeddings'),
+    (('upscale_models', 'upscale'), 'upscale_models'),
+    (('style_models', 'style'), 'style_models'),
+    (('gligen',), 'gligen'),
+    (('hypernetworks', 'hypernetwork'), 'hypernetworks'),
+    (('photomaker',), 'photomaker'),
+    (('classifiers', 'classifier'), 'classifiers'),
+    (('diffusers',), 'diffusers'),
+    (('rembg',), 'rembg'),
+    # Common custom node model directories
+    (('ipadapter', 'ip_adapter', 'ip-adapter'), 'ipadapter'),
+    (('animatediff', 'motion_module', 'motion-module'), 'animatediff'),
+    (('insightface', 'face_analysis', 'face-analysis'), 'insightface'),
+    (('instantid', 'instant_id', 'instant-id'), 'instantid'),
+    (('inpaint',), 'inpaint'),
+    (('segmentation', 'segment'), 'segmentation'),
+    (('depth', 'depth_estimation'), 'depth_estimation'),
+    (('pose', 'pose_estimation', 'openpose'), 'pose_estimation'),
+    (('video', 'video_models'), 'video_models'),
+    (('audio', 'audio_models'), 'audio_models'),
+)
+
+
 class ModelConfigManager:
     """Integration class for the model configuration manager shell script"""
     
@@ -91,128 +175,20 @@ class ModelConfigManager:
         
         # First, try to use provided model_type
         if model_type:
-            type_mapping = {
-                # Core model types from ComfyUI nodes.py
-                'checkpoint': 'checkpoints',
-                'checkpoints': 'checkpoints',
-                'diffusion_model': 'diffusion_models',
-                'rembg': 'rembg',
-                'diffusion_models': 'diffusion_models',
-                'unet': 'unet',
-                'vae': 'vae',
-                'vae_approx': 'vae_approx',
-                'text_encoder': 'text_encoders',
-                'text_encoders': 'text_encoders',
-                'clip': 'clip',
-                'clip_vision': 'clip_vision',
-                'lora': 'loras',
-                'loras': 'loras',
-                'controlnet': 'controlnet',
-                't2i_adapter': 'controlnet',
-                'embedding': 'embeddings',
-                'embeddings': 'embeddings',
-                'upscale_model': 'upscale_models',
-                'upscale_models': 'upscale_models',
-                'style_model': 'style_models',
-                'style_models': 'style_models',
-                'gligen': 'gligen',
-                'hypernetwork': 'hypernetworks',
-                'hypernetworks': 'hypernetworks',
-                'photomaker': 'photomaker',
-                'classifier': 'classifiers',
-                'classifiers': 'classifiers',
-                'diffuser': 'diffusers',
-                'diffusers': 'diffusers',
-                # Additional custom node types
-                'ipadapter': 'ipadapter',
-                'ip_adapter': 'ipadapter',
-                'animatediff': 'animatediff',
-                'motion_module': 'animatediff',
-                'insightface': 'insightface',
-                'face_analysis': 'insightface',
-                'instantid': 'instantid',
-                'inpaint': 'inpaint',
-                'segmentation': 'segmentation',
-                'depth_estimation': 'depth_estimation',
-                'pose_estimation': 'pose_estimation',
-                'video_model': 'video_models',
-                'audio_model': 'audio_models',
-            }
-            mapped_type = type_mapping.get(model_type.lower())
+            mapped_type = MODEL_TYPE_GROUPS.get(model_type.lower())
             if mapped_type:
                 return mapped_type
         
         # Comprehensive path-based detection based on ComfyUI's folder
-        # structure. Order matters - more specific patterns first
-        
-        # Core ComfyUI model directories from folder_paths.py
-        if any(x in local_path for x in ['checkpoints', 'checkpoint']):
-            return 'checkpoints'
-        elif any(x in local_path for x in ['diffusion_models', 'unet']):
-            return 'diffusion_models'
-        elif 'vae_approx' in local_path or 'taesd' in local_path:
-            return 'vae_approx'
-        elif 'vae' in local_path:
-            return 'vae'
-        elif 'clip_vision' in local_path:
-            return 'clip_vision'
-        elif any(x in local_path for x in ['text_encoders', 't5']):
-            return 'text_encoders'
-        elif any(x in local_path for x in ['loras', 'lora']):
-            return 'loras'
-        elif any(x in local_path for x in ['controlnet', 't2i_adapter']):
-            return 'controlnet'
-        elif any(x in local_path for x in ['embeddings', 'embedding']):
-            return 'embeddings'
-        elif any(x in local_path for x in ['upscale_models', 'upscale']):
-            return 'upscale_models'
-        elif any(x in local_path for x in ['style_models', 'style']):
-            return 'style_models'
-        elif 'gligen' in local_path:
-            return 'gligen'
-        elif any(x in local_path for x in ['hypernetworks', 'hypernetwork']):
-            return 'hypernetworks'
-        elif 'photomaker' in local_path:
-            return 'photomaker'
-        elif any(x in local_path for x in ['classifiers', 'classifier']):
-            return 'classifiers'
-        elif 'diffusers' in local_path:
-            return 'diffusers'
-        elif 'rembg' in local_path:
-            return 'rembg'
-        
-        # Common custom node model directories
-        elif any(x in local_path for x in
-                 ['ipadapter', 'ip_adapter', 'ip-adapter']):
-            return 'ipadapter'
-        elif any(x in local_path for x in
-                 ['animatediff', 'motion_module', 'motion-module']):
-            return 'animatediff'
-        elif any(x in local_path for x in
-                 ['insightface', 'face_analysis', 'face-analysis']):
-            return 'insightface'
-        elif any(x in local_path for x in
-                 ['instantid', 'instant_id', 'instant-id']):
-            return 'instantid'
-        elif 'inpaint' in local_path:
-            return 'inpaint'
-        elif any(x in local_path for x in ['segmentation', 'segment']):
-            return 'segmentation'
-        elif any(x in local_path for x in ['depth', 'depth_estimation']):
-            return 'depth_estimation'
-        elif any(x in local_path for x in
-                 ['pose', 'pose_estimation', 'openpose']):
-            return 'pose_estimation'
-        elif any(x in local_path for x in ['video', 'video_models']):
-            return 'video_models'
-        elif any(x in local_path for x in ['audio', 'audio_models']):
-            return 'audio_models'
-        
-        # Fallback for unknown types
-        else:
-            # extract the model type from the path
-            extracted_type = self._determine_model_type_from_path(local_path)
-            return extracted_type or "other"
+        # structure, using the precomputed ordered rule table
+        for needles, group in _PATH_GROUP_RULES:
+            for needle in needles:
+                if needle in local_path:
+                    return group
+        
+        # Fallback for unknown types: extract the model type from the path
+        extracted_type = self._determine_model_type_from_path(local_path)
+        return extracted_type or "other"
     
     def _determine_model_type_from_path(self, local_path: str) -> str:
         """Extract model type from ComfyUI models directory structure.
@@ -647,15 +623,14 @@ class ModelConfigManager:
             
             # Remove everything up to and including '/models/'
             relative_path = normalized_path[models_index + len(models_prefix):]
-            path_parts = relative_path.split('/')
-            
-            if len(path_parts) < 2:
-                # If no group or model name, return the whole relative path
-                return relative_path
             
             # Skip the first part (group) and return everything after
             # Handles nested dirs like: {group}/{subdir}/{modelName}
-            return '/'.join(path_parts[1:])
+            group, sep, model_name = relative_path.partition('/')
+            if not sep:
+                # If no group or model name, return the whole relative path
+                return relative_path
+            return model_name
             
         except Exception as e:
             logger.warning(f"Could not extract model name from path "
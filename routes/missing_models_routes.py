@@ -2,7 +2,7 @@ import asyncio
 import json
 from aiohttp import web
 from ..missing_models_handler import missing_model_handler, missing_model_progress_store, MissingModelProgressTracker
-from ..shared_state import download_cancellation_flags
+from ..shared_state import request_cancellation
 
 def setup_missing_models_routes(routes):
     """Setup missing models related routes"""
@@ -78,7 +78,7 @@ def setup_missing_models_routes(routes):
                 }, status=400)
             
             # Set cancellation flag
-            download_cancellation_flags[session_id] = True
+            request_cancellation(session_id)
             
             # Update progress
             MissingModelProgressTracker.set_cancelled(session_id, "Download cancelled by user")
@@ -1,6 +1,22 @@
 """
 Shared state module to avoid circular imports
 """
+import os
+
+# Per-update progress lines are only printed when FSM_DEBUG_PROGRESS is set;
+# terminal states (completed/error/cancelled) are always printed
+DEBUG_PROGRESS = os.environ.get("FSM_DEBUG_PROGRESS", "").lower() in ("1", "true", "yes")
 
 # Global download cancellation flags
 download_cancellation_flags = {}
+
+# Per-session events for downloads that can be interrupted mid-await
+# (set by request_cancellation; registered by the download while it runs)
+download_cancel_events = {}
+
+def request_cancellation(session_id: str):
+    """Flag a session as cancelled and wake a download waiting on its event"""
+    download_cancellation_flags[session_id] = True
+    event = download_cancel_events.get(session_id)
+    if event is not None:
+        event.set()
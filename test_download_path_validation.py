@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test script to verify download path validation rejects paths outside the ComfyUI base
+"""
+import os
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+# Add the current directory to Python path to import our modules
+sys.path.insert(0, str(Path(__file__).parent))
+
+
+def load_download_api(base_path):
+    """Import download_endpoints with stand-ins for the ComfyUI modules it needs"""
+    sys.modules.setdefault('folder_paths', types.ModuleType('folder_paths'))
+    sys.modules['folder_paths'].base_path = base_path
+    if 'server' not in sys.modules:
+        server = types.ModuleType('server')
+        server.PromptServer = type('PromptServer', (), {'instance': None})
+        sys.modules['server'] = server
+
+    from download_endpoints import FileSystemDownloadAPI
+    return FileSystemDownloadAPI()
+
+
+def test_validate_path():
+    """Test _validate_path against sibling, traversal and absolute paths"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        base = os.path.join(temp_dir, "ComfyUI")
+        api = load_download_api(base)
+
+        # Paths inside the base are accepted and resolved against it
+        is_valid, result = api._validate_path("sub/file.safetensors")
+        assert is_valid, f"Expected sub/file.safetensors to be accepted, got {result}"
+        assert result == os.path.join(base, "sub", "file.safetensors"), result
+
+        is_valid, result = api._validate_path("sub/../other/file.txt")
+        assert is_valid and result == os.path.join(base, "other", "file.txt"), result
+
+        # A sibling directory sharing the base name as a prefix is outside the base
+        sibling = os.path.basename(base) + "2"
+        is_valid, result = api._validate_path(f"../{sibling}/file.txt")
+        assert not is_valid and result == "Access denied", f"Sibling {sibling} was accepted: {result}"
+
+        # Traversal out of the base
+        for path in ("../file.txt", "sub/../../file.txt", "../../etc/passwd"):
+            is_valid, result = api._validate_path(path)
+            assert not is_valid and result == "Access denied", f"{path} was accepted: {result}"
+
+        # Absolute paths outside the base, including the sibling
+        for path in ("/etc/passwd", base + "2/file.txt", temp_dir):
+            is_valid, result = api._validate_path(path)
+            assert not is_valid and result == "Access denied", f"{path} was accepted: {result}"
+
+        # An absolute path inside the base is still inside it
+        is_valid, result = api._validate_path(os.path.join(base, "sub", "file.txt"))
+        assert is_valid, f"Absolute path inside the base was rejected: {result}"
+
+        is_valid, result = api._validate_path("")
+        assert not is_valid and result == "No file path provided", result
+
+        print("✅ All path validation tests passed!")
+
+
+if __name__ == "__main__":
+    test_validate_path()